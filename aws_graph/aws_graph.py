@@ -1,17 +1,33 @@
 # Standard libraries
+import sys
+
+# The gevent engine runs the workers as greenlets instead of threads, the
+# standard library must be patched before boto3 and its ssl usage are imported
+if '--engine=gevent' in sys.argv:
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        print "gevent is not installed, falling back to the threads engine"
+        sys.argv.remove('--engine=gevent')
+
 import os
 import json
 import logging
 import datetime
-import threading
 
 # Internal dependencies
-from libraries import get_session, get_account_list
-from libraries import scan
-from libraries import get_default_graph, fill_graph_from_resources, render_graph
+from libraries import get_sessions, get_account_list
+from libraries import scan, schedule_scan, scan_in_processes
+from libraries import WorkerPool
+from libraries import set_max_pool_connections, set_rate_limiter
+from libraries import release_clients
+from libraries import get_region_list, submit_region_list
+from libraries import GraphWriter, DotWriter
 from libraries import set_default_options, set_options_from_cli
-from libraries import set_services_from_cli
-from libraries import print_json
+from libraries import set_services_from_cli, get_resource_filters
+from libraries import JsonWriter, SqliteWriter
+from libraries import ExportStage
 
 
 def set_up_log(config):
@@ -56,58 +72,155 @@ def set_up_log(config):
     iam_logger.addHandler(handler)
     iam_logger.setLevel(log_level)
 
+    # Adding FileHandler to the model logger
+    model_logger = logging.getLogger('libraries.model.Model')
+    model_logger.addHandler(handler)
+    model_logger.setLevel(log_level)
+
     # Adding FileHandler to the ec2 logger
     ec2_logger = logging.getLogger('libraries.model.EC2')
     ec2_logger.addHandler(handler)
     ec2_logger.setLevel(log_level)
 
-def get_resources(accounts, config, services):
-    """ This function loads an aws account node children """
+    # Adding FileHandler to the cache logger
+    cache_logger = logging.getLogger('libraries.Cache')
+    cache_logger.addHandler(handler)
+    cache_logger.setLevel(log_level)
+
+    # Adding FileHandler to the rate limiter logger
+    rate_limit_logger = logging.getLogger('libraries.RateLimit')
+    rate_limit_logger.addHandler(handler)
+    rate_limit_logger.setLevel(log_level)
+
+    # Adding FileHandler to the workers logger
+    workers_logger = logging.getLogger('libraries.Workers')
+    workers_logger.addHandler(handler)
+    workers_logger.setLevel(log_level)
 
-    # Preparing a list to store the threads if the multi-threading is enabled
-    # for the accounts scans
+    # Adding FileHandler to the scan logger
+    scan_logger = logging.getLogger('libraries.Scan')
+    scan_logger.addHandler(handler)
+    scan_logger.setLevel(log_level)
+
+def get_resources(accounts, config, services, on_account_scanned=None):
+    """ This function loads an aws account node children,
+        on_account_scanned is called with every account node
+        as soon as its scan is finished
+    """
+
+    # The process engine scans the accounts in a pool of processes,
+    # it is started before any thread of this process
+    if config.get('engine') == 'process':
+        scan_in_processes(accounts, config, services, on_account_scanned)
+        return
+
+    # Preparing a worker pool shared by the accounts scans
+    # if the multi-threading is enabled
     if config.get('threading'):
-        threads = []
+        pool = WorkerPool(config.get('workers'))
+    # The iam user login details queries are bounded by their own pool
+    iam_pool = WorkerPool(config.get('iam-workers'))
+    # Sizing the clients connection pools for the workers sharing them
+    set_max_pool_connections(max(config.get('workers'),
+                                 config.get('iam-workers')))
+    # Pacing the API calls by account, service and region
+    set_rate_limiter(rate=config.get('rate-limit'),
+                     max_rate=config.get('MaxRateLimit'),
+                     max_attempts=config.get('ThrottlingRetries'))
 
-    for account in accounts:
-        # Getting a boto3 session using the connection option
-        # set in the configuration
-        session = get_session(account, config)
+    # Getting the boto3 sessions using the connection option
+    # set in the configuration, the assume role calls are done concurrently
+    sessions = get_sessions(accounts, config)
+
+    for account, session in zip(accounts, sessions):
         if session is None:
             if account.json.get('Name'):
                 print ("  Connection to account "
                        + account.json['Name'] + " failed")
             else:
                 print "Connection to account " + account.id + " failed"
+            if on_account_scanned is not None:
+                on_account_scanned(account)
             continue
-        # Using aws api to get latest region list if all the region are scanned
-        if config.get('region') == 'all':
-            ec2_client = session.client('ec2', region_name='eu-west-1')
-            region_list = [
-                region.get('RegionName')
-                for region in ec2_client.describe_regions().get('Regions')
-            ]
-        else:
-            region_list = [config.get('region')]
-
+        # Getting the account region list, the aws region list is
+        # discovered once per run and cached on disk if all the region are scanned
         if config.get('threading'):
-            # Launching the scan function in a daemon thread
-            # to parallelize the aws api calls
-            thread = threading.Thread(
-                target=scan,
-                args=(account, region_list, services, session))
-            thread.setDaemon(True)
-            threads.append(thread)
-            thread.start()
+            # The region probes are run by the pool, the account scan
+            # is scheduled once the region list is known
+            region_task = submit_region_list(pool, session, account, config)
+            pool.submit_when_finished([region_task], schedule_account_scan,
+                                      pool, account, region_task, services,
+                                      session, iam_pool, config,
+                                      on_account_scanned)
         else:
+            region_list = get_region_list(session, account, config)
             scan(account=account, region_list=region_list,
-                 services=services, session=session)
+                 services=services, session=session, iam_pool=iam_pool,
+                 credential_report=config.get('CredentialReport'),
+                 filters=get_resource_filters(config))
+            if on_account_scanned is not None:
+                on_account_scanned(account)
 
     if config.get('threading'):
-        for thread in threads:
-            # waithing for the threads to end before building the graphviz graph
-            while thread.isAlive():
-                thread.join()
+        # waithing for the units to end
+        pool.join()
+        pool.close()
+    iam_pool.close()
+
+def schedule_account_scan(pool, account, region_task, services, session,
+                          iam_pool, config, on_account_scanned=None):
+    """ This function splits the account scan in (account, region, service)
+        units run by the pool to parallelize the aws api calls, the account
+        is handed over once all its units are finished
+    """
+    # The regions are not scanned if their listing failed (logged by the pool)
+    region_list = region_task.result
+    if region_list is None:
+        region_list = []
+    tasks = schedule_scan(pool=pool, account=account,
+                          region_list=region_list, services=services,
+                          session=session, iam_pool=iam_pool,
+                          credential_report=config.get('CredentialReport'),
+                          filters=get_resource_filters(config))
+    # Handing the account over once all its units are finished,
+    # including the failed ones
+    pool.submit_when_finished(tasks, end_account_scan, account,
+                              on_account_scanned)
+
+def end_account_scan(account, on_account_scanned=None):
+    """ This function releases the clients of a scanned account
+        and hands the account node to on_account_scanned
+    """
+    release_clients(account.id)
+    if on_account_scanned is not None:
+        on_account_scanned(account)
+
+def get_export_stage(config, services):
+    """ This function returns the export stage writing the scanned accounts
+        in the output selected in the configuration
+    """
+    if config['OutputType'] in ('json', 'ndjson'):
+        # Dumping node's json to output file if it is the desired format
+        writer = JsonWriter(ndjson=config['OutputType'] == 'ndjson',
+                            compress=config.get('compress'))
+        return ExportStage(writer, queue_size=config.get('ExportQueueSize'))
+    if config['OutputType'] == 'sqlite':
+        # Writing the nodes in an indexed sqlite inventory
+        writer = SqliteWriter()
+        return ExportStage(writer, queue_size=config.get('ExportQueueSize'))
+    if config.get('DotStream'):
+        # Streaming the resources nodes aws graphiz representation
+        # to a file or to dot without building the graph in memory
+        writer = DotWriter(services, config.get('OutputImageFormat'),
+                           to_dot=config.get('DotStream') == 'stdin')
+    else:
+        # Filling a graph with the resources nodes aws graphiz representation
+        # rendered as an image once complete
+        writer = GraphWriter(services, config.get('OutputImageFormat'))
+    # not showing empty accounts
+    return ExportStage(writer, max_depth=int(config.get('max-depth')),
+                       skip_empty_accounts=True,
+                       queue_size=config.get('ExportQueueSize'))
 
 ##############
 #### MAIN ####
@@ -146,28 +259,25 @@ def main():
     set_options_from_cli(config)
     services = set_services_from_cli(default_services_selection)
 
-    # Creating a Digraph object from graphviz library and adding default options
-    graph = get_default_graph()
+    # The greenlets of the gevent engine scan the accounts concurrently
+    if config.get('engine') == 'gevent':
+        config['threading'] = True
 
     # Using the connection function set in the configuration
     # to create an account node list
     account_list = get_account_list(config)
 
+    # The scanned accounts are exported while the other accounts are scanned
+    export_stage = get_export_stage(config, services)
+
     # Using configuration to open an AWS session by account
     # and query the account's resources using boto3 client API
     # to loads the account resources nodes
-    get_resources(account_list, config, services)
-
-    if config['OutputType'] == 'json':
-        # Dumping node's json to output file if it is the desired format
-        print_json(account_list)
-    else:
-        # Fill the graph by printing the resources nodes aws graphiz representation
-        fill_graph_from_resources(config, account_list, graph)
+    get_resources(account_list, config, services,
+                  on_account_scanned=export_stage.put)
 
-        # Rendering the graph as an image
-        output_image_format = config.get('OutputImageFormat')
-        render_graph(graph, services, output_image_format)
+    # Waiting for the last accounts to be exported
+    export_stage.close()
 
 # Only run the main function if the file is python entry point
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+# Standard libraries
+import io
+import os
+import json
+import time
+import logging
+import threading
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+###################
+#### DISK CACHE ###
+###################
+
+# Serializing the cache files accesses of the workers
+_lock = threading.Lock()
+
+def get_cache_dir(config):
+    """ Returns the cache directory set in config.json, the relative paths
+        are relative to the aws_graph script directory like the logs directory
+    """
+    cache_dir = config.get('CACHE_DIR')
+    if not cache_dir:
+        cache_dir = '.aws_graph_cache'
+    if cache_dir.startswith('.'):
+        script_path = (os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                       + os.sep)
+        cache_dir = script_path + cache_dir.split('.')[1]
+    return cache_dir
+
+def load_cache(config, name, ttl):
+    """ Returns the data stored in the cache file name
+        or None if the file is missing, unreadable or older than ttl seconds
+    """
+    cache_file = get_cache_dir(config) + os.sep + name + '.json'
+    with _lock:
+        try:
+            with io.open(cache_file, encoding='utf-8') as json_file:
+                cache = json.load(json_file)
+        except (OSError, IOError, ValueError):
+            return None
+    if time.time() - cache.get('Timestamp', 0) > ttl:
+        return None
+    return cache.get('Data')
+
+def save_cache(config, name, data, private=False):
+    """ Storing json serializable data in the cache file name,
+        private files (like credentials) are only readable by their owner
+    """
+    cache_dir = get_cache_dir(config)
+    cache_file = cache_dir + os.sep + name + '.json'
+    with _lock:
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            # Private files are created with owner only permissions
+            # before anything is written in them
+            mode = 0o600 if private else 0o666
+            cache_fd = os.open(cache_file,
+                               os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+            if private:
+                os.chmod(cache_file, mode)
+            with io.open(cache_fd, 'wb') as json_file:
+                json_file.write(json.dumps({'Timestamp': time.time(),
+                                            'Data': data}))
+        except (OSError, IOError) as error:
+            # The scan does not need the cache to succeed
+            logging.getLogger(__name__).warning(error)
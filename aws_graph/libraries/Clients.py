@@ -0,0 +1,59 @@
+# Standard libraries
+import threading
+
+# External libraries
+from botocore.config import Config
+
+# Internal dependencies
+from libraries.RateLimit import attach_rate_limiter
+
+######################
+#### CLIENT CACHE ####
+######################
+
+# The boto3 clients are thread safe but building one loads the service model,
+# the clients of an account scan are built once by (account id, service,
+# region) and shared by the fillers and the workers, they are released once
+# the account scan is finished (cf release_clients). The clients used outside
+# of an account scan (like the organization client) are cached by session.
+# Clients by (service, region) by account id or session
+_clients = {}
+_lock = threading.Lock()
+# Size of the HTTP connection pool of the clients, set to the scan concurrency
+_max_pool_connections = 10
+
+def set_max_pool_connections(max_pool_connections):
+    """ Setting the HTTP connection pool size of the clients built afterward,
+        it should match the number of workers sharing a client
+    """
+    global _max_pool_connections
+    _max_pool_connections = max(10, int(max_pool_connections))
+
+def get_client(session, service, region=None, account_id=None):
+    """ Returns the cached boto3 client of the account session for the service
+        and the region, building it on first use
+    """
+    owner = account_id if account_id is not None else session
+    client = _clients.get(owner, {}).get((service, region))
+    if client is None:
+        # boto3 sessions are not thread safe, the clients are built
+        # while holding the lock
+        with _lock:
+            owner_clients = _clients.setdefault(owner, {})
+            client = owner_clients.get((service, region))
+            if client is None:
+                client = session.client(
+                    service, region_name=region,
+                    config=Config(max_pool_connections=_max_pool_connections))
+                # The calls of the account for the service and the region
+                # share a rate limiter token bucket
+                attach_rate_limiter(client, (owner, service, region))
+                owner_clients[(service, region)] = client
+    return client
+
+def release_clients(account_id):
+    """ Dropping the cached clients of an account once its scan is finished,
+        the account session and its clients can then be garbage collected
+    """
+    with _lock:
+        _clients.pop(account_id, None)
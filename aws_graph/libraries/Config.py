@@ -1,4 +1,5 @@
 import sys
+import multiprocessing
 
 def set_default_options(config):
     """
@@ -12,14 +13,60 @@ def set_default_options(config):
         config['Accounts'] = 'single'
     if not config.get('threading'):
         config['threading'] = False
+    if not config.get('engine'):
+        config['engine'] = 'threads'
+    if not config.get('processes'):
+        config['processes'] = multiprocessing.cpu_count()
+    if not config.get('workers'):
+        config['workers'] = 10
+    if not config.get('iam-workers'):
+        config['iam-workers'] = 10
+    if config.get('rate-limit') is None:
+        config['rate-limit'] = 10
+    if not config.get('MaxRateLimit'):
+        config['MaxRateLimit'] = 100
+    if not config.get('ThrottlingRetries'):
+        config['ThrottlingRetries'] = 10
     if not config.get('env'):
         config['env'] = 'all'
+    if not config.get('EnvTagKey'):
+        config['EnvTagKey'] = 'Environment'
     if not config.get('match'):
         config['match'] = ''
     if not config.get('max-depth'):
         config['max-depth'] = -1
+    if not config.get('RegionCacheTTL'):
+        config['RegionCacheTTL'] = 86400
+    if not config.get('ProbeRegions'):
+        config['ProbeRegions'] = False
+    if not config.get('ActiveRegionCacheTTL'):
+        config['ActiveRegionCacheTTL'] = 604800
+    if not config.get('RefreshRegions'):
+        config['RefreshRegions'] = False
+    if not config.get('DiscoveryRegion'):
+        config['DiscoveryRegion'] = 'eu-west-1'
+    if config.get('AccountListCacheTTL') is None:
+        config['AccountListCacheTTL'] = 3600
+    if not config.get('CredentialCacheTTL'):
+        config['CredentialCacheTTL'] = 43200
+    if not config.get('CredentialReport'):
+        config['CredentialReport'] = False
     if not config.get('OutputType'):
         config['OutputType'] = 'graphviz'
+    if not config.get('compress'):
+        config['compress'] = False
+    if not config.get('ExportQueueSize'):
+        config['ExportQueueSize'] = 4
+
+def get_resource_filters(config):
+    """ Returns the describe calls filters selecting the resources
+        of the environment set with the env option, tagged with the
+        EnvTagKey tag, or an empty list if every environment is scanned
+    """
+    if config.get('env') in (None, 'all'):
+        return []
+    return [{'Name': 'tag:' + config.get('EnvTagKey'),
+             'Values': [config.get('env')]}]
 
 def set_options_from_cli(config):
     """ Setting config options from command line parameters """
@@ -42,12 +89,63 @@ def set_options_from_cli(config):
         if arg.startswith('--match='):
             config['match'] = arg.split('=')[1]
 
+        if arg.startswith('--ou='):
+            config['OrganizationalUnits'] = arg.split('=')[1].split(',')
+
+        if arg.startswith('--engine='):
+            config['engine'] = arg.split('=')[1]
+
+        if arg.startswith('--processes='):
+            try:
+                config['processes'] = int(arg.split('=')[1])
+            except ValueError:
+                pass
+
+        if arg.startswith('--workers='):
+            try:
+                config['workers'] = int(arg.split('=')[1])
+            except ValueError:
+                pass
+
+        if arg.startswith('--iam-workers='):
+            try:
+                config['iam-workers'] = int(arg.split('=')[1])
+            except ValueError:
+                pass
+
+        if arg.startswith('--rate-limit='):
+            try:
+                config['rate-limit'] = float(arg.split('=')[1])
+            except ValueError:
+                pass
+
         if arg.startswith('--threading'):
             config['threading'] = True
 
         if arg.startswith('--json'):
             config['OutputType'] = 'json'
 
+        if arg.startswith('--ndjson'):
+            config['OutputType'] = 'ndjson'
+
+        if arg.startswith('--probe-regions'):
+            config['ProbeRegions'] = True
+
+        if arg.startswith('--refresh-regions'):
+            config['RefreshRegions'] = True
+
+        if arg.startswith('--credential-report'):
+            config['CredentialReport'] = True
+
+        if arg.startswith('--sqlite'):
+            config['OutputType'] = 'sqlite'
+
+        if arg.startswith('--gzip'):
+            config['compress'] = True
+
+        if arg.startswith('--dot-stream='):
+            config['DotStream'] = arg.split('=')[1]
+
 def set_services_from_cli(default_services_selection):
     """ Setting services selection from command line parameters """
     services = {}
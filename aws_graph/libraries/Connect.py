@@ -1,16 +1,37 @@
 # Standard libraries
 import json
+import time
+import hashlib
 import logging
+import calendar
+import datetime
+import threading
 
 # External libraries
 import boto3
+import botocore.session
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError
 
 # Internal dependencies
+from libraries.Cache import load_cache, save_cache
+from libraries.Clients import get_client
+from libraries.Pagination import get_items
+from libraries.Workers import WorkerPool
 from libraries.model import create_account_node
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
+# Assumed role credentials by (role arn, role session name)
+_credentials = {}
+_credentials_loaded = False
+# Root sessions by profile name
+_root_sessions = {}
+_lock = threading.Lock()
+# Credentials expiring in less than this number of seconds are renewed,
+# it matches the botocore advisory refresh period of the session credentials
+CREDENTIALS_EXPIRY_MARGIN = 900
+
 #################
 #### CONNECT ####
 #################
@@ -44,48 +65,104 @@ def get_account_list(config):
     return account_list
 
 def get_account_list_from_organization(config):
-    """ use config file parameters to query the account list from organization
+    """ use config file parameters to query the account list from organization,
+        the whole organization or only the accounts of the organizational units
+        set in the configuration, the list is cached on disk
     """
+    unit_ids = config.get('OrganizationalUnits') or []
+    # The cached list depends on the profile and role listing the accounts
+    # and on the organizational units
+    cache_key = json.dumps([config.get('ProfileName'),
+                            config.get('OrganizationScanningRoleArn'),
+                            sorted(unit_ids)])
+    cache_name = ('organization-accounts-'
+                  + hashlib.sha1(cache_key).hexdigest())
+    ttl = config.get('AccountListCacheTTL')
+    if ttl > 0:
+        account_list = load_cache(config, cache_name, ttl)
+        if account_list is not None:
+            return account_list
+
     # Getting root session
-    if config.get('ProfileName'):
-        root_session = boto3.Session(profile_name=config.get('ProfileName'))
-    else:
-        root_session = boto3.Session()
+    root_session = get_root_session(config.get('ProfileName'))
     # Using the root session to assume the organization scanning role
     if config.get('OrganizationScanningRoleArn'):
-        sts_client = root_session.client('sts')
-
         # The call will throw an exception if you lack the rights
-        response = sts_client.assume_role(
-            RoleArn=config.get('OrganizationScanningRoleArn'),
-            RoleSessionName=config.get('RoleSessionName')
-        )
-
-        credentials = response['Credentials']
         # Building a session using the assumed role credentials
-        session = boto3.Session(
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken']
+        session = get_role_session(
+            root_session=root_session,
+            role_arn=config.get('OrganizationScanningRoleArn'),
+            config=config
         )
     else:
         # Trying with the current session
         session = root_session
 
     # Using the session to scan organization
-    organization_client = session.client('organizations')
-
-    # The call will throw an exception if you lack the rights
-    response = organization_client.list_accounts()
+    organization_client = get_client(session, 'organizations')
 
+    # The calls will throw an exception if you lack the rights
     # Building the account json list using the scanned account
-    account_list = response['Accounts']
-    while response.get('NextToken'):
-        response = organization_client.list_accounts(
-            NextToken=response.get('NextToken'))
-        account_list.extend(response['Accounts'])
+    if unit_ids:
+        account_list = get_account_list_from_units(
+            organization_client, unit_ids, config.get('workers'))
+    else:
+        account_list = list(get_items(organization_client, 'list_accounts',
+                                      'Accounts'))
+    if ttl > 0:
+        # The account timestamps are stored as strings in the cache,
+        # the outputs write both forms the same way (cf json_serial)
+        save_cache(config, cache_name, [
+            {key: (value.isoformat() if hasattr(value, 'isoformat') else value)
+             for key, value in account.items()}
+            for account in account_list
+        ])
     return account_list
 
+def get_account_list_from_units(organization_client, unit_ids, workers):
+    """ Returns the accounts of the organizational units and of their
+        descendant units, the units subtrees are walked concurrently
+    """
+    pool = WorkerPool(workers)
+    # The tasks submitted by the walk and the account lists of the units
+    tasks = []
+    account_lists = []
+    for unit_id in unit_ids:
+        tasks.append(pool.submit(walk_organizational_unit, pool,
+                                 organization_client, unit_id,
+                                 tasks, account_lists))
+    pool.join()
+    pool.close()
+    for task in tasks:
+        # An incomplete account list must not be used nor cached
+        if task.error is not None:
+            raise task.error
+    # A unit and one of its descendants can both be listed
+    accounts = {}
+    for account_list in account_lists:
+        for account in account_list:
+            accounts[account['Id']] = account
+    return sorted(accounts.values(), key=lambda account: account['Id'])
+
+def walk_organizational_unit(pool, organization_client, unit_id,
+                             tasks, account_lists):
+    """ Submitting the listing of the accounts of an organizational unit
+        and the walk of its child units
+    """
+    tasks.append(pool.submit(list_unit_accounts, organization_client,
+                             unit_id, account_lists))
+    for child in get_items(organization_client, 'list_children', 'Children',
+                           ParentId=unit_id, ChildType='ORGANIZATIONAL_UNIT'):
+        tasks.append(pool.submit(walk_organizational_unit, pool,
+                                 organization_client, child.get('Id'),
+                                 tasks, account_lists))
+
+def list_unit_accounts(organization_client, unit_id, account_lists):
+    """ Adding the account list of an organizational unit to account_lists """
+    account_lists.append(list(get_items(organization_client,
+                                        'list_accounts_for_parent', 'Accounts',
+                                        ParentId=unit_id)))
+
 def get_account_list_from_json():
     """ Parsing accounts.json to return a json account list """
     with open('accounts.json') as json_file:
@@ -170,28 +247,110 @@ def assume_role(account, config):
 
     # Connecting to the Iam Federating account using configurated profile
     if account.json.get('ProfileName'):
-        profile_name = account.json.get('ProfileName')
-        root_session = boto3.Session(profile_name=profile_name)
-    elif config.get('ProfileName'):
-        profile_name = config.get('ProfileName')
-        root_session = boto3.Session(profile_name=profile_name)
+        root_session = get_root_session(account.json.get('ProfileName'))
     else:
-        root_session = boto3.Session()
+        root_session = get_root_session(config.get('ProfileName'))
 
     # Using the root session to scan the federing iam account
     if account.json.get('Name') == config.get('AccountName'):
         return root_session
 
     # Assuming the role in the federed account
-    sts_client = root_session.client('sts')
+    return get_role_session(root_session=root_session, role_arn=role_arn,
+                            config=config)
+
+def get_sessions(account_list, config):
+    """ Returns the session list of the account list, the sessions are built
+        concurrently so the assume role calls of every account are done
+        before the scan instead of one after another. The assumed role
+        credentials are renewed by the sessions when they are about to expire,
+        so the accounts scanned last do not use expired credentials.
+    """
+    pool = WorkerPool(config.get('workers'))
+    tasks = [pool.submit(get_session, account, config)
+             for account in account_list]
+    pool.join()
+    pool.close()
+    # The failed connections have been logged by the pool
+    return [task.result for task in tasks]
+
+def get_root_session(profile_name=None):
+    """ Returns the boto3 session of the profile or the default session,
+        it is built once and shared by the assume role calls
+    """
+    with _lock:
+        if profile_name not in _root_sessions:
+            if profile_name:
+                _root_sessions[profile_name] = boto3.Session(
+                    profile_name=profile_name)
+            else:
+                _root_sessions[profile_name] = boto3.Session()
+        return _root_sessions[profile_name]
+
+def get_role_credentials(root_session, role_arn, config):
+    """ Returns the credentials of the role assumed with the root session
+        The credentials are cached in memory and optionally on disk
+        ("CredentialCache" option) until they expire, the cached credentials
+        are only returned if they are valid for CREDENTIALS_EXPIRY_MARGIN
+        seconds at least
+    """
+    global _credentials_loaded
+    session_name = config.get('RoleSessionName')
+    key = role_arn + ' ' + str(session_name)
+    with _lock:
+        # Loading the disk cache on first use
+        if not _credentials_loaded and config.get('CredentialCache'):
+            _credentials_loaded = True
+            cached_credentials = load_cache(config, 'credentials',
+                                            config.get('CredentialCacheTTL'))
+            if cached_credentials:
+                _credentials.update(cached_credentials)
+        credentials = _credentials.get(key)
+    if (credentials is not None
+            and credentials['Expiration'] - time.time()
+            > CREDENTIALS_EXPIRY_MARGIN):
+        return credentials
+
+    # The call will throw an exception if you lack the rights
+    sts_client = get_client(root_session, 'sts')
     response = sts_client.assume_role(
         RoleArn=role_arn,
-        RoleSessionName=config.get('RoleSessionName')
-    )
-    credentials = response['Credentials']
-    session = boto3.Session(
-        aws_access_key_id=credentials['AccessKeyId'],
-        aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
+        RoleSessionName=session_name
     )
-    return session
+    credentials = {
+        'AccessKeyId': response['Credentials']['AccessKeyId'],
+        'SecretAccessKey': response['Credentials']['SecretAccessKey'],
+        'SessionToken': response['Credentials']['SessionToken'],
+        # Storing the expiration as a timestamp to keep it json serializable
+        'Expiration': calendar.timegm(
+            response['Credentials']['Expiration'].utctimetuple())
+    }
+    with _lock:
+        _credentials[key] = credentials
+        if config.get('CredentialCache'):
+            save_cache(config, 'credentials', _credentials, private=True)
+    return credentials
+
+def get_role_session(root_session, role_arn, config):
+    """ Building a session using the credentials of the role assumed with
+        the root session, the session checks the credentials expiration on
+        every call and gets renewed credentials (cf get_role_credentials)
+        when they are about to expire
+    """
+    def refresh():
+        """ Returns the role credentials in the botocore metadata format """
+        credentials = get_role_credentials(root_session=root_session,
+                                           role_arn=role_arn, config=config)
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': datetime.datetime.utcfromtimestamp(
+                credentials['Expiration']).strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
+    botocore_session = botocore.session.get_session()
+    # boto3 sessions can not be built with refreshable credentials,
+    # they are set on the underlying botocore session
+    botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+        metadata=refresh(), refresh_using=refresh, method='assume-role')
+    return boto3.Session(botocore_session=botocore_session)
@@ -0,0 +1,78 @@
+# Standard libraries
+import logging
+import threading
+from Queue import Queue
+
+# Internal dependencies
+from libraries.Clients import release_clients
+from libraries.model import registry
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+######################
+#### EXPORT STAGE ####
+######################
+
+class ExportStage(object):
+    """ The export stage writes the account subtrees with an output writer
+        (JsonWriter, SqliteWriter, DotWriter or GraphWriter) as soon as each
+        account is scanned, while the other accounts are still scanned.
+
+        The scanners put their finished account in a bounded queue consumed
+        by the export thread, a full queue blocks the scanners so only a few
+        scanned subtrees are held in memory. Each subtree is released
+        once exported.
+    """
+
+    def __init__(self, writer, max_depth=-1, skip_empty_accounts=False,
+                 queue_size=4):
+        self.writer = writer
+        self.max_depth = max_depth
+        self.skip_empty_accounts = skip_empty_accounts
+        self._queue = Queue(max(1, int(queue_size)))
+        # The export thread is started by the first scanned account, after
+        # the process engine has forked its scanning processes
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, account):
+        """ Handing a scanned account node to the export thread,
+            waiting if the queue is full
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._export)
+                self._thread.setDaemon(True)
+                self._thread.start()
+        self._queue.put(account)
+
+    def close(self):
+        """ Waiting for the queued accounts to be exported
+            and closing the writer
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            # None is the signal sent to stop the export thread
+            self._queue.put(None)
+            thread.join()
+        self.writer.close()
+
+    def _export(self):
+        """ Export thread loop """
+        while True:
+            account = self._queue.get()
+            if account is None:
+                return
+            if account.children != [] or not self.skip_empty_accounts:
+                try:
+                    self.writer.write_nodes([account], max_depth=self.max_depth)
+                except Exception as error:
+                    # The other accounts are still exported
+                    logging.getLogger(__name__).warning(
+                        'Export of account ' + str(account.id)
+                        + ' failed: ' + repr(error))
+            # Releasing the exported subtree and the account clients
+            registry.release_account(account.id)
+            release_clients(account.id)
+            account.release_children()
@@ -1,8 +1,13 @@
+import os
 import datetime
+import subprocess
 
 # External libraries
 from graphviz import Digraph
 
+# Internal dependencies
+from libraries.model import traverse
+
 
 def get_default_graph():
     """ Setting graphviz graph global options """
@@ -13,22 +18,8 @@ def get_default_graph():
     graph.node_attr.update(shape='rectangle', style='filled', color='black')
     return graph
 
-def fill_graph_from_resources(config, accounts, graph):
-    """ This function takes an account node list to
-        add the graphviz representation of the nodes
-        and their children nodes
-    """
-    # for each account node
-    for account in accounts:
-        # not showing empty accounts
-        if account.children != []:
-            max_depth = int(config.get('max-depth'))
-            # Calling the print_graphviz of the account node
-            # to fill the string array with the nodes and edges
-            account.print_graphviz(subgraph=graph.body, max_depth=max_depth)
-
-def render_graph(graph, services, output_image_format=None):
-    """ Render the graph in an output file. """
+def get_output_filename(services):
+    """ Returns the graphviz output file name using the shown services """
     # add the shown services to the graph name
     srv = ''
     if services.get('ec2'):
@@ -41,12 +32,157 @@ def render_graph(graph, services, output_image_format=None):
         srv += '-s3'
     if services.get('cloudtrail'):
         srv += '-ct'
+    return ('aws-graph-output/aws-graph-'
+            + datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S")
+            + srv + '.gv')
+
+def render_graph(graph, services, output_image_format=None):
+    """ Render the graph in an output file. """
     if output_image_format is None:
         graph.format = 'svg'
     else:
         graph.format = output_image_format
-    output_filename = ('aws-graph-output/aws-graph-'
-                       + datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S")
-                       + srv + '.gv')
+    output_filename = get_output_filename(services)
     print "Dumping graphviz output file to " + output_filename
-    graph.render(output_filename, view=True)
+    try:
+        graph.render(output_filename, view=True)
+    except (RuntimeError, OSError) as error:
+        # The graphviz library raises a RuntimeError when dot is missing
+        # and an OSError when the image viewer is missing
+        print "The graph could not be rendered: " + str(error)
+
+class GraphWriter(object):
+    """ The graph writer adds the graphviz representation of the nodes
+        to a graph of the graphviz library rendered once complete
+    """
+
+    def __init__(self, services, output_image_format=None):
+        self.graph = get_default_graph()
+        self.services = services
+        self.output_image_format = output_image_format
+
+    def write_nodes(self, roots, max_depth=-1):
+        """ Adding the nodes reachable from the roots and their edges """
+        traverse(
+            roots, max_depth=max_depth,
+            pre_order=lambda node: self.graph.body.append(
+                node.identifier + ' ' + node.style),
+            edge=lambda father, child: self.graph.body.append(
+                father.identifier + ' -> ' + child.identifier)
+        )
+
+    def close(self):
+        """ Rendering the graph as an image """
+        render_graph(self.graph, self.services, self.output_image_format)
+
+class DotWriter(object):
+    """ The dot writer streams the DOT statements of the nodes and edges
+        while the nodes are traversed, to the .gv output file rendered by dot
+        once complete, or directly to the standard input of dot, so the graph
+        source is never held in memory.
+
+        An edge drawn from several fathers (like a policy attached to many
+        principals) is only written once.
+    """
+
+    def __init__(self, services, output_image_format=None, to_dot=False):
+        if output_image_format is None:
+            output_image_format = 'svg'
+        self.output_image_format = output_image_format
+        self.output_filename = get_output_filename(services)
+        output_dir = os.path.dirname(self.output_filename)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self._dot = None
+        # Whether dot is run to render the .gv file once written
+        self._render = True
+        if to_dot:
+            # The dot process renders the graph from its standard input
+            self.image_filename = (self.output_filename + '.'
+                                   + output_image_format)
+            try:
+                self._dot = subprocess.Popen(
+                    ['dot', '-T' + output_image_format, '-o',
+                     self.image_filename],
+                    stdin=subprocess.PIPE)
+            except OSError as error:
+                # The graph source is kept in the .gv file instead
+                print ("The graph could not be rendered, failed to execute "
+                       "dot: " + str(error))
+                self._render = False
+        if self._dot is not None:
+            self._output_file = self._dot.stdin
+        else:
+            self._output_file = open(self.output_filename, 'wb')
+        # Identifiers pairs of the written edges
+        self._edges = set()
+        # Same global options as the default graph (cf get_default_graph)
+        self._output_file.write(
+            'digraph AWS {\n'
+            '\tsplines=line\n'
+            '\trankdir=LR\n'
+            '\toutputorder=edgesfirst\n'
+            '\tnode [color=black shape=rectangle style=filled]\n')
+
+    def write_nodes(self, roots, max_depth=-1):
+        """ Writing the statements of the nodes reachable from the roots """
+        traverse(roots, max_depth=max_depth, pre_order=self.write_node,
+                 edge=self.write_edge)
+
+    def write_node(self, node):
+        """ Writing the statement of a node """
+        self._write('\t' + node.identifier + ' ' + node.style + '\n')
+
+    def write_edge(self, father, child):
+        """ Writing the statement of an edge if it was not written yet """
+        edge = (father.identifier, child.identifier)
+        if edge in self._edges:
+            return
+        self._edges.add(edge)
+        self._write('\t' + father.identifier + ' -> ' + child.identifier
+                    + '\n')
+
+    def _write(self, statement):
+        """ Writing a statement, the non ascii characters (like the ones of
+            an account name) are written in utf-8, the dot default charset
+        """
+        if isinstance(statement, unicode):
+            statement = statement.encode('utf-8')
+        self._output_file.write(statement)
+
+    def close(self):
+        """ Ending the graph and rendering it, a failed rendering
+            is reported as the graphviz library render does
+        """
+        if self._dot is not None:
+            try:
+                self._output_file.write('}\n')
+                self._output_file.close()
+            except IOError:
+                # dot exited before reading the whole graph,
+                # its exit code is reported below
+                pass
+            return_code = self._dot.wait()
+            if return_code != 0:
+                print ("The graph could not be rendered, dot exited with "
+                       "code " + str(return_code))
+                return
+            print "Dumping graphviz output image to " + self.image_filename
+            return
+        self._output_file.write('}\n')
+        self._output_file.close()
+        print "Dumping graphviz output file to " + self.output_filename
+        if not self._render:
+            return
+        try:
+            # dot -O names the image like the graphviz library render
+            return_code = subprocess.call(
+                ['dot', '-T' + self.output_image_format, '-O',
+                 self.output_filename])
+        except OSError as error:
+            print ("The graph could not be rendered, failed to execute "
+                   "dot: " + str(error))
+            return
+        if return_code != 0:
+            print ("The graph could not be rendered, dot exited with code "
+                   + str(return_code))
@@ -1,7 +1,11 @@
 import io
+import gzip
 import json
 from datetime import datetime
 
+# Internal dependencies
+from libraries.model import traverse
+
 def json_serial(obj):
     """ JSON serializer for objects not serializable by default json code:
         allows to avoid datetime non-serialisable exceptions in json dumps
@@ -12,22 +16,55 @@ def json_serial(obj):
         return serial
     raise TypeError("Type not serializable")
 
-def print_json(account_list):
-    """ This function takes the account node list and print a json dump
-        of all the nodes in the list.
+class JsonWriter(object):
+    """ The json writer streams one json record by node to the output file
+        while the nodes are traversed, so the output is never built in memory.
+
+        The records are written as a json array, or one record by line
+        in the ndjson format, and can be gzip compressed.
     """
-    json_node_list = []
-    # Adding the json of every node for each account in the list
-    for account_node in account_list:
-        account_node.print_json(json_node_list)
-
-    output_file_name = ('aws-graph-output/output-'
-                        + datetime.now().strftime("%Y-%m-%d %H-%M-%S")
-                        + '.json')
-    # Writing the json to the output file
-    with io.open(output_file_name, 'w', encoding='utf-8') as output_file:
-        # Converting the list of dict to write
-        output_file.write(
-            json.dumps(json_node_list, default=json_serial, ensure_ascii=False)
-        )
-    print "Dumping json output to " + output_file_name
+
+    def __init__(self, ndjson=False, compress=False):
+        self.ndjson = ndjson
+        self.output_file_name = ('aws-graph-output/output-'
+                                 + datetime.now().strftime("%Y-%m-%d %H-%M-%S"))
+        if ndjson:
+            self.output_file_name += '.ndjson'
+        else:
+            self.output_file_name += '.json'
+        if compress:
+            self.output_file_name += '.gz'
+            self._output_file = gzip.open(self.output_file_name, 'wb')
+        else:
+            self._output_file = io.open(self.output_file_name, 'wb')
+        self._record_count = 0
+        if not ndjson:
+            self._output_file.write('[')
+
+    def write_nodes(self, roots, max_depth=-1):
+        """ Writing the records of the nodes reachable from the roots """
+        traverse(roots, max_depth=max_depth, pre_order=self.write_node)
+        # Making the records available to the output file readers
+        self._output_file.flush()
+
+    def write_node(self, node):
+        """ Writing the json record of a node """
+        record = json.dumps({node.resource_type : node.json},
+                            default=json_serial, ensure_ascii=False)
+        # The non ascii characters are written in utf-8 instead of escaped
+        if isinstance(record, unicode):
+            record = record.encode('utf-8')
+        if self.ndjson:
+            self._output_file.write(record + '\n')
+        elif self._record_count == 0:
+            self._output_file.write(record)
+        else:
+            self._output_file.write(', ' + record)
+        self._record_count += 1
+
+    def close(self):
+        """ Ending the json array and closing the output file """
+        if not self.ndjson:
+            self._output_file.write(']')
+        self._output_file.close()
+        print "Dumping json output to " + self.output_file_name
@@ -0,0 +1,55 @@
+####################
+#### PAGINATION ####
+####################
+
+# Maximum page size accepted by the paginated API calls, the largest pages
+# need the fewest round trips, the other calls use the API default page size
+MAX_PAGE_SIZES = {
+    'describe_instances': 1000,
+    'describe_volumes': 500,
+    'describe_vpcs': 1000,
+    'describe_subnets': 1000,
+    'describe_vpc_peering_connections': 1000,
+    'describe_db_instances': 100,
+    'get_account_authorization_details': 1000,
+    'list_mfa_devices': 1000,
+    'list_access_keys': 1000,
+    'list_accounts': 20,
+    'list_children': 20,
+    'list_accounts_for_parent': 20,
+}
+
+def get_pages(client, operation, **kwargs):
+    """ Yields the response pages of the client operation called with the
+        keyword arguments as they are received, requesting the maximum
+        page size. The operations without botocore paginator are paginated
+        using their NextToken or Marker response field if they have one.
+    """
+    if client.can_paginate(operation):
+        pagination_config = {}
+        if operation in MAX_PAGE_SIZES:
+            pagination_config['PageSize'] = MAX_PAGE_SIZES[operation]
+        paginator = client.get_paginator(operation)
+        for page in paginator.paginate(PaginationConfig=pagination_config,
+                                       **kwargs):
+            yield page
+        return
+    call = getattr(client, operation)
+    while True:
+        response = call(**kwargs)
+        yield response
+        # The same arguments are sent with the token of the next page
+        if response.get('NextToken'):
+            kwargs['NextToken'] = response['NextToken']
+        elif response.get('Marker') and response.get('IsTruncated', True):
+            kwargs['Marker'] = response['Marker']
+        else:
+            return
+
+def get_items(client, operation, result_key, **kwargs):
+    """ Yields the items of the result_key list of every page
+        of the client operation (cf get_pages)
+    """
+    for page in get_pages(client, operation, **kwargs):
+        for item in page.get(result_key) or []:
+            yield item
@@ -0,0 +1,160 @@
+# Standard libraries
+import time
+import random
+import logging
+import threading
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+# Error codes returned by the AWS APIs when the calls are throttled
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'SlowDown',
+    'PriorRequestNotComplete',
+    'ProvisionedThroughputExceededException',
+}
+
+######################
+#### TOKEN BUCKET ####
+######################
+
+class TokenBucket(object):
+    """ A token bucket allows rate calls per second with bursts up to
+        the bucket capacity, the rate is adapted to the throttling responses:
+        it is halved on every throttling and slowly increased on success
+    """
+
+    def __init__(self, rate, max_rate):
+        self.rate = float(rate)
+        self.min_rate = min(1.0, self.rate)
+        self.max_rate = max(float(max_rate), self.rate)
+        self.capacity = self.rate
+        self.tokens = self.rate
+        self.timestamp = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Waiting for a token to be available and consuming it """
+        while True:
+            with self._lock:
+                now = time.time()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.timestamp) * self.rate)
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_throttle(self):
+        """ Multiplicative decrease of the rate on throttling """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.capacity = max(1.0, self.rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def on_success(self):
+        """ Additive increase of the rate, about one call per second
+            every second without throttling
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+            self.capacity = max(1.0, self.rate)
+
+######################
+#### RATE LIMITER ####
+######################
+
+class RateLimiter(object):
+    """ The rate limiter holds a token bucket by (account id, service,
+        region) shared by every worker and paces the calls of the clients
+        it is attached to using the botocore events, every attempt of a call
+        takes a token, the retries included
+    """
+
+    def __init__(self, rate, max_rate, max_attempts):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.max_attempts = max_attempts
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, key):
+        """ Returns the token bucket of the key, creating it on first use """
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.max_rate)
+            return self._buckets[key]
+
+    def attach(self, client, key):
+        """ Registering the client event handlers using the key bucket """
+        bucket = self.get_bucket(key)
+        max_attempts = self.max_attempts
+
+        def before_attempt(**kwargs):
+            """ Waiting for a token before every attempt of an API call,
+                the request of each attempt (retries included) is created
+                once the retry delay is elapsed
+            """
+            bucket.acquire()
+
+        def after_call(parsed, **kwargs):
+            """ Increasing the rate after a successful call """
+            if not is_throttling_response(parsed):
+                bucket.on_success()
+
+        def needs_retry(response, attempts, **kwargs):
+            """ Decreasing the rate and returning a jittered backoff delay
+                when the call is throttled, the other errors are left to
+                the default botocore retry handler
+            """
+            if response is None or not is_throttling_response(response[1]):
+                return None
+            bucket.on_throttle()
+            logging.getLogger(__name__).info(
+                'Throttled on ' + str(key[1:]) + ', rate set to '
+                + str(bucket.rate) + ' calls per second')
+            if attempts >= max_attempts:
+                return None
+            # Full jitter exponential backoff
+            return random.uniform(0, min(20, 0.5 * 2 ** attempts))
+
+        events = client.meta.events
+        # Registered first to take the token before the request is signed
+        events.register_first('request-created.'
+                              + client.meta.service_model.endpoint_prefix,
+                              before_attempt)
+        events.register('after-call', after_call)
+        # Registered first to handle the throttling before the default handler
+        events.register_first('needs-retry', needs_retry)
+
+def is_throttling_response(parsed):
+    """ Checks if a parsed AWS API response is a throttling error """
+    if not parsed:
+        return False
+    return parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+# The rate limiter shared by the clients, disabled by default
+_rate_limiter = None
+
+def set_rate_limiter(rate, max_rate, max_attempts):
+    """ Enabling the rate limiter for the clients built afterward,
+        a rate lower or equal to zero disables it
+    """
+    global _rate_limiter
+    if rate > 0:
+        _rate_limiter = RateLimiter(rate, max_rate, max_attempts)
+    else:
+        _rate_limiter = None
+
+def attach_rate_limiter(client, key):
+    """ Attaching the rate limiter to the client if it is enabled """
+    if _rate_limiter is not None:
+        _rate_limiter.attach(client, key)
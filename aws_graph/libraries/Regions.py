@@ -0,0 +1,176 @@
+# Standard libraries
+import threading
+
+# Internal dependencies
+from libraries.Cache import load_cache, save_cache
+from libraries.Clients import get_client
+from libraries.Pagination import get_items
+from libraries.Workers import WorkerPool
+
+##########################
+#### REGION DISCOVERY ####
+##########################
+
+# The region list is discovered once per run and shared by every account
+_region_list = None
+_lock = threading.Lock()
+
+def get_region_list(session, account, config):
+    """ Returns the list of the regions to scan for an account:
+        the discovered region list if every region is scanned or the
+        configured region, filtered by the allowed and denied regions
+        of the account and of the configuration.
+        When every region is scanned with the ProbeRegions option
+        the empty regions of the account are skipped.
+    """
+    region_list = get_candidate_regions(session, account, config)
+    if config.get('region') == 'all' and config.get('ProbeRegions'):
+        region_list = probe_regions(session, account, region_list, config)
+    return region_list
+
+def submit_region_list(pool, session, account, config):
+    """ Returns a task of the pool whose result is the region list to scan
+        for an account (cf get_region_list), the region probes are run by
+        the pool workers so the accounts are probed concurrently
+    """
+    region_list = get_candidate_regions(session, account, config)
+    if config.get('region') != 'all' or not config.get('ProbeRegions'):
+        return pool.submit(list, region_list)
+    known_regions, probes = submit_probes(pool, session, account,
+                                          region_list, config)
+    # The failed probes are handled by get_active_regions
+    return pool.submit_when_finished(
+        [probe for _, probe in probes], get_active_regions, account,
+        region_list, known_regions, probes, config)
+
+def get_candidate_regions(session, account, config):
+    """ Returns the discovered region list if every region is scanned or
+        the configured region, filtered by the allowed and denied regions
+    """
+    if config.get('region') == 'all':
+        region_list = discover_regions(session, account, config)
+    else:
+        region_list = [config.get('region')]
+    return filter_regions(region_list, account, config)
+
+def discover_regions(session, account, config):
+    """ Returns the AWS region list from the disk cache if it is recent
+        enough, otherwise using aws api to get latest region list
+    """
+    global _region_list
+    with _lock:
+        if _region_list is None and not config.get('RefreshRegions'):
+            _region_list = load_cache(config, 'regions',
+                                      config.get('RegionCacheTTL'))
+        if _region_list is None:
+            ec2_client = get_client(session, 'ec2',
+                                    config.get('DiscoveryRegion'),
+                                    account_id=account.id)
+            _region_list = [
+                region.get('RegionName')
+                for region in get_items(ec2_client, 'describe_regions',
+                                        'Regions')
+            ]
+            save_cache(config, 'regions', _region_list)
+    return list(_region_list)
+
+def filter_regions(region_list, account, config):
+    """ Filtering a region list using the "AllowedRegions" and
+        "DeniedRegions" lists of the account json, the config file
+        lists being used when the account does not set them
+    """
+    allowed_regions = account.json.get('AllowedRegions')
+    if not allowed_regions:
+        allowed_regions = config.get('AllowedRegions')
+    denied_regions = account.json.get('DeniedRegions')
+    if not denied_regions:
+        denied_regions = config.get('DeniedRegions')
+    if allowed_regions:
+        region_list = [region for region in region_list
+                       if region in allowed_regions]
+    if denied_regions:
+        region_list = [region for region in region_list
+                       if region not in denied_regions]
+    return region_list
+
+#######################
+#### REGION PROBES ####
+#######################
+
+def probe_regions(session, account, region_list, config):
+    """ Returns the regions of the list where the account has resources,
+        the known active regions of the account are kept in the disk cache
+        so they are scanned without being probed in the next runs
+    """
+    # Probing the regions concurrently
+    pool = WorkerPool(config.get('workers'))
+    known_regions, probes = submit_probes(pool, session, account,
+                                          region_list, config)
+    pool.wait([probe for _, probe in probes])
+    pool.close()
+    return get_active_regions(account, region_list, known_regions, probes,
+                              config)
+
+def submit_probes(pool, session, account, region_list, config):
+    """ Returns the known active regions of the account from the disk cache,
+        or None if they are unknown, and the (region, task) pairs of the
+        probes submitted to the pool for the other regions of the list
+    """
+    known_regions = None
+    if not config.get('RefreshRegions'):
+        known_regions = load_cache(config, 'active-regions-' + account.id,
+                                   config.get('ActiveRegionCacheTTL'))
+    probes = [(region, pool.submit(is_region_active, session, account.id,
+                                   region))
+              for region in region_list
+              if known_regions is None or region not in known_regions]
+    return known_regions, probes
+
+def get_active_regions(account, region_list, known_regions, probes, config):
+    """ Returns the regions of the list that are known to be active
+        or whose probe found resources
+    """
+    # A failed probe (logged by the pool) does not prove the region is empty
+    new_regions = [region for region, probe in probes
+                   if probe.result or probe.error is not None]
+    failed_probes = [probe for _, probe in probes if probe.error is not None]
+    if known_regions is None:
+        # The cache is only written once every region is probed, so that
+        # the regions left empty are probed again when the cache expires,
+        # the regions found active meanwhile are probed on every run.
+        # The regions of the failed probes are not known to be active,
+        # they are probed again in the next run
+        if failed_probes == []:
+            save_cache(config, 'active-regions-' + account.id, new_regions)
+        known_regions = []
+    return [region for region in region_list
+            if region in known_regions or region in new_regions]
+
+def is_region_active(session, account_id, region):
+    """ Checks if the account has resources in the region using calls
+        returning a single minimal page: the non default vpcs,
+        the ec2 instances (including the ones of the default vpcs),
+        the rds instances and the trails created in the region
+    """
+    ec2_client = get_client(session, 'ec2', region, account_id=account_id)
+    # describe_vpcs is not paginated, every non default vpc is returned
+    response = ec2_client.describe_vpcs(
+        Filters=[{'Name': 'isDefault', 'Values': ['false']}])
+    if response.get('Vpcs'):
+        return True
+    # The instances of every vpc are counted
+    response = ec2_client.describe_instances(
+        Filters=[{'Name': 'instance-state-name',
+                  'Values': ['pending', 'running', 'stopping', 'stopped']}],
+        MaxResults=5)
+    if response.get('Reservations'):
+        return True
+    rds_client = get_client(session, 'rds', region, account_id=account_id)
+    response = rds_client.describe_db_instances(MaxRecords=20)
+    if response.get('DBInstances'):
+        return True
+    # The multi region trails created in other regions are left out
+    cloudtrail_client = get_client(session, 'cloudtrail', region,
+                                   account_id=account_id)
+    response = cloudtrail_client.describe_trails(includeShadowTrails=False)
+    return bool(response.get('trailList'))
@@ -1,7 +1,23 @@
-from libraries.model import fill_region, fill_iam, fill_ec2, fill_network
+# Standard libraries
+import logging
+import multiprocessing
+
+# Internal dependencies
+from libraries.Clients import set_max_pool_connections, release_clients
+from libraries.Config import get_resource_filters
+from libraries.Connect import get_session
+from libraries.RateLimit import set_rate_limiter
+from libraries.Regions import get_region_list
+from libraries.Workers import WorkerPool
+from libraries.model import fill_region, fill_iam
 from libraries.model import fill_s3, fill_rds, fill_cloudtrail
+from libraries.model import RegionSnapshot
+from libraries.model import fill_network_from_snapshot, fill_ec2_from_snapshot
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
 
-def scan(account, region_list, services, session):
+def scan(account, region_list, services, session, workers=None,
+         iam_pool=None, credential_report=False, filters=None):
     """
     scan load an account node children ressources using the session parameter to
     query AWS API on the aws services selected in the services parameter
@@ -16,34 +32,181 @@ def scan(account, region_list, services, session):
         dictionary that references the services to be scanned
     session
         a boto3 session allowing to query AWS APIs
+    workers : int
+        number of threads scanning the account, by default two per region
+        so that every region is scanned concurrently
+    iam_pool : WorkerPool (object define in Workers.py)
+        optional pool querying the iam user login details
+    credential_report : bool
+        read the iam user login details from the credential report
+    filters : [{'Name':str, 'Values':[str]}]
+        optional tag filters of the network, ec2 and rds resources
+        (cf get_resource_filters)
     """
-    # Loads the s3 resources to the account node children
-    if services.get('s3'):
-        fill_s3(session=session, account=account)
-    # Loads the iam resources to the account node children
-    if services.get('iam'):
-        fill_iam(session=session, account=account)
+    if workers is None:
+        workers = 2 * max(1, len(region_list))
+    pool = WorkerPool(workers)
+    schedule_scan(pool=pool, account=account, region_list=region_list,
+                  services=services, session=session, iam_pool=iam_pool,
+                  credential_report=credential_report, filters=filters)
+    # Waiting for every unit of the account before returning
+    pool.join()
+    pool.close()
+    # The account clients are not used anymore
+    release_clients(account.id)
+
+def schedule_scan(pool, account, region_list, services, session,
+                  iam_pool=None, credential_report=False, filters=None):
+    """
+    schedule_scan splits an account scan in (account, region, service) units
+    and submits them to a worker pool, possibly shared by several accounts.
+
+    In a region, the describe calls of the ec2 snapshot (vpcs, subnets,
+    instances and volumes) and the cloudtrail unit are independent and run
+    concurrently, the network nodes are built once the vpcs and subnets are
+    loaded and the ec2 and rds units wait for the region network nodes,
+    so the network is fetched exactly once per region.
 
+    Parameters
+    ----------
+    pool : WorkerPool (object define in Workers.py)
+        the pool running the units
+    account, region_list, services, session, iam_pool, credential_report,
+    filters
+        same as the scan function parameters
+
+    Returns
+    -------
+    [Task]
+        the submitted units
+    """
+    tasks = []
     # Checking whether the region_node will be necessary
     region_based_services = (services.get('cloudtrail')
                              or services.get('network')
                              or services.get('ec2')
                              or services.get('rds'))
-
     if region_based_services:
-        # Using the parameter region_list to create region nodes
-        # to host the resources of the region based services
+        # The region nodes are created before submitting any unit so that
+        # the account children list is not modified by this function
+        # while the s3 and iam units append their nodes to it
         fill_region(region_list=region_list, account=account)
-        region_node_list = account.get_child_list('Region')
+
+    # Account based services units
+    if services.get('s3'):
+        tasks.append(pool.submit(fill_s3, session=session, account=account))
+    if services.get('iam'):
+        tasks.append(pool.submit(fill_iam, session=session, account=account,
+                                 pool=iam_pool,
+                                 credential_report=credential_report))
+    if not region_based_services:
+        return tasks
+
+    for region_node in account.get_child_list('Region'):
         if services.get('cloudtrail'):
-            for region_node in region_node_list:
-                fill_cloudtrail(session, region_node)
-        if services.get('network'):
-            for region_node in region_node_list:
-                fill_network(session, region_node)
-        if services.get('ec2'):
-            for region_node in region_node_list:
-                fill_ec2(session, region_node)
-        if services.get('rds'):
-            for region_node in region_node_list:
-                fill_rds(session, region_node)
+            tasks.append(pool.submit(fill_cloudtrail, session, region_node))
+        # The ec2 and rds nodes are children of the region vpc and subnet
+        # nodes, the network is loaded whenever one of them is selected
+        if (services.get('network')
+                or services.get('ec2')
+                or services.get('rds')):
+            snapshot = RegionSnapshot(session, region_node, filters=filters)
+            network_loads = [pool.submit(snapshot.load, 'Vpcs'),
+                             pool.submit(snapshot.load, 'Subnets')]
+            ec2_loads = []
+            if services.get('ec2'):
+                ec2_loads = [pool.submit(snapshot.load, 'Instances'),
+                             pool.submit(snapshot.load, 'Volumes')]
+            tasks.extend(network_loads + ec2_loads)
+            network_task = pool.submit_after(network_loads,
+                                             fill_network_from_snapshot,
+                                             snapshot)
+            tasks.append(network_task)
+            if services.get('ec2'):
+                tasks.append(pool.submit_after([network_task] + ec2_loads,
+                                               fill_ec2_from_snapshot,
+                                               snapshot))
+            if services.get('rds'):
+                tasks.append(pool.submit_after([network_task], fill_rds,
+                                               session, region_node,
+                                               filters=filters))
+    return tasks
+
+def scan_in_processes(account_list, config, services, on_account_scanned=None):
+    """
+    scan_in_processes scans every account of the list in a pool of
+    processes, so that the nodes building is not limited to one core.
+
+    Each process returns its scanned account node (pickled with its node tree)
+    that replaces the account node of the list, the output functions can then
+    use the list like a list scanned by threads. The nodes are indexed in the
+    registry of the scanning process, where the shared nodes are merged.
+    The accounts are handed to on_account_scanned as soon as they are
+    scanned, whatever their order in the list.
+
+    Parameters
+    ----------
+    account_list : [node]
+        the account node list, modified in place
+    config : dict
+        the script configuration, it must be picklable
+    services : {service_name:bool}
+        dictionary that references the services to be scanned
+    on_account_scanned : function(account)
+        optional function called with every account node once scanned
+    """
+    pool = multiprocessing.Pool(config.get('processes'))
+    arguments = [(index, account, config, services)
+                 for index, account in enumerate(account_list)]
+    # The accounts are received in the order their scan ends
+    scanned_accounts = pool.imap_unordered(scan_account, arguments)
+    for index, scanned_account in scanned_accounts:
+        if scanned_account is not None:
+            account_list[index] = scanned_account
+        if on_account_scanned is not None:
+            on_account_scanned(account_list[index])
+    pool.close()
+    pool.join()
+
+def scan_account(arguments):
+    """ Scanning an account in a process of the scan_in_processes pool,
+        the arguments are an (index, account, config, services) tuple
+        and the (index, scanned account node) tuple is returned
+        to the parent process, the scanned account node being None
+        if the connection or the scan failed
+    """
+    index, account, config, services = arguments
+    try:
+        # The clients settings are not inherited by spawned processes
+        set_max_pool_connections(max(config.get('workers'),
+                                     config.get('iam-workers')))
+        set_rate_limiter(rate=config.get('rate-limit'),
+                         max_rate=config.get('MaxRateLimit'),
+                         max_attempts=config.get('ThrottlingRetries'))
+        # Getting a boto3 session using the connection option
+        # set in the configuration
+        session = get_session(account, config)
+        if session is None:
+            if account.json.get('Name'):
+                print ("  Connection to account "
+                       + account.json['Name'] + " failed")
+            else:
+                print "Connection to account " + account.id + " failed"
+            return index, None
+        region_list = get_region_list(session, account, config)
+        iam_pool = WorkerPool(config.get('iam-workers'))
+        scan(account=account, region_list=region_list, services=services,
+             session=session, workers=config.get('workers'),
+             iam_pool=iam_pool,
+             credential_report=config.get('CredentialReport'),
+             filters=get_resource_filters(config))
+        iam_pool.close()
+        return index, account
+    except Exception as error:
+        # An exception raised in the process would stop the other scans,
+        # and some of them (like the botocore ClientError) cannot be
+        # unpickled by the parent process
+        logging.getLogger(__name__).warning(
+            'Scan of account ' + str(account.id) + ' failed: ' + repr(error))
+        print "Scan of account " + str(account.id) + " failed"
+        return index, None
@@ -0,0 +1,119 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+# Internal dependencies
+from libraries.JsonPrint import json_serial
+from libraries.model import traverse, get_account_id, get_region
+
+# Number of rows inserted by transaction
+BATCH_SIZE = 10000
+
+class SqliteWriter(object):
+    """ The sqlite writer stores the nodes reached by a traversal in an
+        indexed sqlite inventory file: a nodes table with the json of every
+        node as payload and an edges table between the nodes.
+
+        The rows are inserted by batches, one transaction by batch.
+
+        The inventory is created by the thread building the writer but
+        filled by the export thread, the connection is shared between
+        the threads and used by one thread at a time.
+    """
+
+    def __init__(self):
+        self.output_file_name = ('aws-graph-output/output-'
+                                 + datetime.now().strftime("%Y-%m-%d %H-%M-%S")
+                                 + '.sqlite')
+        # The rows of a previous inventory with the same name are not kept
+        if os.path.exists(self.output_file_name):
+            os.remove(self.output_file_name)
+        self._connection = sqlite3.connect(self.output_file_name,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.executescript(
+            'CREATE TABLE nodes ('
+            ' node INTEGER PRIMARY KEY,'
+            ' id TEXT,'
+            ' type TEXT,'
+            ' service TEXT,'
+            ' account TEXT,'
+            ' region TEXT,'
+            ' parent INTEGER,'
+            ' payload TEXT);'
+            'CREATE TABLE edges ('
+            ' parent INTEGER,'
+            ' child INTEGER);'
+        )
+        self._row_count = 0
+        # Row number of the nodes written by the current traversal
+        # by python object id
+        self._node_rows = {}
+        self._node_batch = []
+        self._edge_batch = []
+
+    def write_nodes(self, roots, max_depth=-1):
+        """ Writing the nodes reachable from the roots and their edges """
+        # The nodes of the previous traversals may have been released
+        # and their object ids reused
+        self._node_rows = {}
+        traverse(roots, max_depth=max_depth, pre_order=self.write_node,
+                 edge=self.write_edge)
+        self._flush()
+
+    def write_node(self, node):
+        """ Adding a node row to the current batch, the account and region
+            of the node are the ones of its father chain since a node shared
+            by several fathers (like the bucket of a trail of another
+            account) is only written once, from the first father traversed
+        """
+        self._row_count += 1
+        row = self._row_count
+        self._node_rows[id(node)] = row
+        parent = None
+        if node.father is not None:
+            parent = self._node_rows.get(id(node.father))
+        self._node_batch.append((
+            row, node.id, node.resource_type, node.service,
+            get_account_id(node), get_region(node), parent,
+            json.dumps(node.json, default=json_serial)
+        ))
+        if len(self._node_batch) >= BATCH_SIZE:
+            self._flush()
+
+    def write_edge(self, father, child):
+        """ Adding an edge row to the current batch """
+        self._edge_batch.append((self._node_rows.get(id(father)),
+                                 self._node_rows.get(id(child))))
+        if len(self._edge_batch) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """ Inserting the current batches in one transaction """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                self._node_batch)
+            self._connection.executemany(
+                'INSERT INTO edges VALUES (?, ?)', self._edge_batch)
+        self._node_batch = []
+        self._edge_batch = []
+
+    def close(self):
+        """ Indexing the tables once filled and closing the inventory """
+        self._flush()
+        with self._lock, self._connection:
+            self._connection.executescript(
+                'CREATE INDEX nodes_id ON nodes (id);'
+                'CREATE INDEX nodes_type ON nodes (type);'
+                'CREATE INDEX nodes_account ON nodes (account);'
+                'CREATE INDEX nodes_region ON nodes (region);'
+                'CREATE INDEX nodes_parent ON nodes (parent);'
+                'CREATE INDEX edges_parent ON edges (parent);'
+                'CREATE INDEX edges_child ON edges (child);'
+            )
+        with self._lock:
+            self._connection.close()
+        print "Dumping sqlite output to " + self.output_file_name
@@ -0,0 +1,162 @@
+# Standard libraries
+import logging
+import threading
+from Queue import Queue
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+##############
+#### TASK ####
+##############
+
+class Task(object):
+    """ A task is a unit of work (a function and its arguments)
+        submitted to a worker pool.
+    """
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        # Filled once the task has been run by a worker
+        self.result = None
+        self.error = None
+        # Number of unfinished tasks this task is waiting for
+        self.remaining_dependencies = 0
+        # Tasks waiting for this task to be finished
+        self.dependents = []
+        self.finished = False
+        # A task is not run if one of its dependencies failed,
+        # unless it only waits for them to be finished
+        self.skip_on_error = True
+
+    def run(self):
+        """ Calling the task function and storing its result or its error """
+        try:
+            self.result = self.function(*self.args, **self.kwargs)
+        except Exception as error:
+            # A failing unit of work must not kill the worker thread
+            # nor the scan of the other units
+            self.error = error
+            logging.getLogger(__name__).warning(
+                'Task ' + getattr(self.function, '__name__', 'unknown')
+                + ' failed: ' + repr(error))
+
+#####################
+#### WORKER POOL ####
+#####################
+
+class WorkerPool(object):
+    """ A worker pool runs the submitted tasks with a fixed number
+        of daemon threads consuming a shared queue.
+        The number of threads bounds the number of AWS API calls in flight
+        whatever the number of accounts, regions and services scanned.
+        With the gevent engine the standard library is patched and the threads
+        are greenlets, so the pool can hold thousands of workers.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, int(size))
+        self._queue = Queue()
+        # Number of submitted tasks that are not finished yet
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        for _ in range(self.size):
+            thread = threading.Thread(target=self._work)
+            thread.setDaemon(True)
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, function, *args, **kwargs):
+        """ Adding a task to the queue, it will be run by the first
+            available worker. Tasks can submit new tasks.
+        """
+        task = Task(function, args, kwargs)
+        with self._condition:
+            self._pending += 1
+        self._queue.put(task)
+        return task
+
+    def submit_after(self, dependencies, function, *args, **kwargs):
+        """ Adding a task that will only be queued once all the tasks
+            in the dependencies list are finished
+        """
+        return self._submit_after(dependencies, Task(function, args, kwargs))
+
+    def submit_when_finished(self, dependencies, function, *args, **kwargs):
+        """ Adding a task that will be queued once all the tasks
+            in the dependencies list are finished, even if some failed
+        """
+        task = Task(function, args, kwargs)
+        task.skip_on_error = False
+        return self._submit_after(dependencies, task)
+
+    def _submit_after(self, dependencies, task):
+        """ Queuing the task or registering it as a dependent
+            of its unfinished dependencies
+        """
+        with self._condition:
+            self._pending += 1
+            for dependency in dependencies:
+                if dependency.error is not None and task.skip_on_error:
+                    task.error = dependency.error
+                if not dependency.finished:
+                    dependency.dependents.append(task)
+                    task.remaining_dependencies += 1
+            ready = task.remaining_dependencies == 0
+        if ready:
+            self._queue.put(task)
+        return task
+
+    def join(self):
+        """ Waiting for every submitted task to be run, including the tasks
+            submitted by other tasks
+        """
+        with self._condition:
+            while self._pending > 0:
+                # Using a timeout so the main thread stays interruptible
+                self._condition.wait(1)
+
+    def wait(self, tasks):
+        """ Waiting for the tasks of the list to be finished, the pool can
+            be shared with other callers waiting for their own tasks
+        """
+        with self._condition:
+            while not all(task.finished for task in tasks):
+                self._condition.wait(1)
+
+    def close(self):
+        """ Stopping the workers once the queue is empty """
+        for _ in self._threads:
+            self._queue.put(None)
+        # Waiting for the workers so they are not stopped
+        # in the middle of the interpreter shutdown
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        """ Worker thread loop """
+        while True:
+            task = self._queue.get()
+            # None is the signal sent by close to stop the worker
+            if task is None:
+                return
+            if task.error is None:
+                task.run()
+            with self._condition:
+                task.finished = True
+                ready_tasks = []
+                for dependent in task.dependents:
+                    # A task is not run if one of its dependencies failed
+                    if task.error is not None and dependent.skip_on_error:
+                        dependent.error = task.error
+                    dependent.remaining_dependencies -= 1
+                    if dependent.remaining_dependencies == 0:
+                        ready_tasks.append(dependent)
+                task.dependents = []
+                self._pending -= 1
+                self._condition.notify_all()
+            for ready_task in ready_tasks:
+                self._queue.put(ready_task)
@@ -1,6 +1,13 @@
-from .Connect import get_account_list, get_session
-from .Scan import scan
-from .Graph import get_default_graph, fill_graph_from_resources, render_graph
+from .Connect import get_account_list, get_session, get_sessions
+from .Scan import scan, schedule_scan, scan_in_processes
+from .Workers import WorkerPool
+from .Clients import get_client, set_max_pool_connections, release_clients
+from .RateLimit import set_rate_limiter
+from .Graph import get_default_graph, render_graph
+from .Graph import GraphWriter, DotWriter
 from .Config import set_default_options, set_options_from_cli
-from .Config import set_services_from_cli
-from .JsonPrint import print_json
+from .Config import set_services_from_cli, get_resource_filters
+from .JsonPrint import JsonWriter
+from .SqlitePrint import SqliteWriter
+from .Export import ExportStage
+from .Regions import get_region_list, submit_region_list
@@ -1,8 +1,8 @@
 import logging
 
 # Internal dependencies
-from Model import Node, get_name_from_tags
-from Network import fill_network
+from libraries.Pagination import get_items
+from Model import Node, get_name_from_tags, get_account_id, registry
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
@@ -10,126 +10,111 @@ logging.getLogger(__name__).addHandler(logging.NullHandler())
 #### EC2 Node Builders ####
 ###########################
 
+def get_instance_label(instance):
+    """ Returns the graphviz label of an ec2 instance node """
+    return ('"' + instance.resource_type
+            + '\n' + get_name_from_tags(instance.json.get('Tags'))
+            + '\n' + instance.json.get('InstanceId') + '"')
+
 def create_instance_node(json, subnet):
     """ aws ec2 instance node builder """
     resource_type = 'Instance'
-    name = get_name_from_tags(json.get('Tags'))
-    label = ('"' + resource_type
-             + '\n' + name
-             + '\n' + json.get('InstanceId') + '"')
     return Node(json=json, resource_type=resource_type,
                 id_type=resource_type + 'Id', color='yellowgreen',
-                label=label, father=subnet, service='ec2')
-
-def create_volume_node(json, instance=None):
-    """ aws ebs volume node builder """
+                label=get_instance_label, father=subnet, service='ec2')
+
+def get_volume_label(volume):
+    """ Returns the graphviz label of an ebs volume node """
+    return ('"' + volume.resource_type
+            + '\nName : ' + get_name_from_tags(volume.json.get('Tags'))
+            + '\nId : ' + volume.json.get('VolumeId')
+            + '\n State : ' + volume.json.get('State')
+            + '\n Type : ' + volume.json.get('VolumeType') + '"')
+
+def create_volume_node(json, father):
+    """ aws ebs volume node builder, the father is the attached instance
+        or the region of a detached volume
+    """
     resource_type = 'Volume'
-    name = get_name_from_tags(json.get('Tags'))
-    label = ('"' + resource_type
-             + '\nName : ' + name
-             + '\nId : ' + json.get(resource_type + 'Id')
-             + '\n State : ' + json.get('State')
-             + '\n Type : ' + json.get('VolumeType') + '"')
     return Node(json=json, resource_type=resource_type,
                 id_type=resource_type + 'Id', color='silver',
-                label=label, father=instance, service='ec2')
+                label=get_volume_label, father=father, service='ec2')
 
 ##############
 #### SCAN ####
 ##############
 
-def fill_ec2(session, region_node):
-    """ this function load all the ec2 service nodes
-        for a region using a region and a boto3 session
+def build_ec2(region_node, instance_json_list, volume_list):
+    """ this function builds the ec2 instance and volume nodes of a region
+        from the describe calls json lists,
+        the region network nodes must be built beforehand
     """
-    # Verifying that network is filled
-    vpc_list = region_node.get_child_list('Vpc')
-    if vpc_list == []:
-        fill_network(session, region_node)
-        vpc_list = region_node.get_child_list('Vpc')
-
     print '  Filling ec2'
-    region = region_node.json.get('Region')
-    ec2_client = session.client('ec2', region_name=region)
-    # Recuperating actives ec2 instances using boto3 client api
-    instance_json_list = get_active_instance_list(ec2_client=ec2_client)
     if instance_json_list != []:
-        # Using list comprehension to get the list of all th subnet
+        # Using the type grouped child lists to get the list of all the subnet
         # in the region for the current account
-        subnet_list = [child
-                       for vpc in vpc_list
-                       for child in vpc.children
-                       if child.resource_type == "Subnet"]
+        subnet_list = region_node.get_grandchild_list('Vpc', 'Subnet')
         # Using the subnet list to instanciate the ec2 instance nodes
         # and adding them to the subnets child lists
-        instance_node_list = add_instances_to_subnets(subnet_list,
-                                                      instance_json_list)
+        add_instances_to_subnets(subnet_list, instance_json_list)
 
-        volume_list = get_volume_list(ec2_client)
         # Creating two list for volume separated by attachment
         attached_volume_list = [v for v in volume_list if is_volume_attached(v)]
-        detached_volume_list = [create_volume_node(v)
+        detached_volume_list = [create_volume_node(v, father=region_node)
                                 for v in volume_list
                                 if not is_volume_attached(v)]
 
+        account_id = region_node.father.id
         for volume in attached_volume_list:
             # Getting attached instance ids
             attached_instance_id = [attachment.get('InstanceId')
                                     for attachment in volume['Attachments']]
             if len(attached_instance_id) != 1:
                 logging.getLogger(__name__).warning(
-                    volume.id + "is attached to an incorrect number of instances"
+                    volume.get('VolumeId')
+                    + " is attached to an incorrect number of instances"
                 )
             else:
                 # Adding the volume to the instances
                 for instance_id in attached_instance_id:
-                    instance = next(instance for instance in instance_node_list
-                                    if instance.id == instance_id)
+                    instance = registry.get(account_id, 'Instance', instance_id)
+                    if instance is None:
+                        logging.getLogger(__name__).warning(
+                            volume.get('VolumeId') + " is attached to "
+                            + instance_id + " that is not a scanned instance"
+                        )
+                        continue
                     instance.children.append(create_volume_node(json=volume,
-                                                                instance=instance))
+                                                                father=instance))
         # Detached instances are rattached to the region node
         # (instead of the non represented Availibility Zones)
         region_node.children.extend(detached_volume_list)
 
-def get_active_instance_list(ec2_client):
+def get_active_instance_list(ec2_client, filters=None):
     """ This function returns the json list of ec2 non terminated instances """
+    if filters is None:
+        filters = []
     # terminated instances are not childrens of a subnet
-    response = ec2_client.describe_instances(
+    reservations = get_items(
+        ec2_client, 'describe_instances', 'Reservations',
         Filters=[
             {'Name': 'instance-state-name',
              'Values':['running', 'stopping', 'stopped']}
-        ]
+        ] + filters
     )
-    # Getting the instances from the json
-    instance_list = [
+    # Getting the instances from the json of every page
+    return [
         instance
-        for reservation in response.get('Reservations')
+        for reservation in reservations
         for instance in reservation.get('Instances')
     ]
-    # If there is too many instances, calling the api with the "next token" will
-    # provide the remaining instances
-    while response.get('NextToken'):
-        response = ec2_client.describe_instances(
-            NextToken=response.get('NextToken'),
-            Filters=[{'Name': 'instance-state-name',
-                      'Values':['running', 'stopping', 'stopped']}])
-        instance_list.extend(
-            [instance
-             for reservation in response.get('Reservations')
-             for instance in reservation.get('Instances')]
-        )
-    return instance_list
-
-def get_volume_list(ec2_client):
+
+def get_volume_list(ec2_client, filters=None):
     """ This function returns the json list of volumes """
-    response = ec2_client.describe_volumes()
-    volume_list = response.get('Volumes')
-    # If there is too many volumes, calling the api with the "next token" will
-    # provide the remaining volumes
-    while response.get('NextToken'):
-        response = ec2_client.describe_volumes()
-        volume_list.extend(response.get('Volumes'))
-    return volume_list
+    if filters is None:
+        filters = []
+    return list(get_items(ec2_client, 'describe_volumes', 'Volumes',
+                          Filters=filters))
 
 def add_instances_to_subnets(subnet_list, instance_list):
     """ Using the subnet nodes as father to build the instance nodes
@@ -138,30 +123,18 @@ def add_instances_to_subnets(subnet_list, instance_list):
     if len(subnet_list) < 1:
         return []
 
-    # Sorting the instance list to avoid the search
-    # when several instances are in the same subnet
-    instance_list = sorted(
-        instance_list,
-        key=lambda instance: instance.get('SubnetId')
-    )
-
-    # Initializing loop variable
-    subnet = subnet_list[0]
-    for index, instance in enumerate(instance_list):
-        if subnet.id != instance['SubnetId']:
-            # Getting the subnet of the current instance
-            # that may be shared by the next instances in the list
-            subnet = next((subnet for subnet in subnet_list
-                           if subnet.id == instance['SubnetId']),
-                          None)
-            # TODO Attach instances with no subnet to their vpc
+    account_id = get_account_id(subnet_list[0])
+    instance_node_list = []
+    for instance in instance_list:
+        # Getting the subnet of the current instance from the registry
+        subnet = registry.get(account_id, 'Subnet', instance.get('SubnetId'))
+        # TODO Attach instances with no subnet to their vpc
         instance = create_instance_node(json=instance, subnet=subnet)
-        # Remplacing the json by the node at the current index of the list
-        instance_list[index] = instance
+        instance_node_list.append(instance)
         if subnet is not None:
             subnet.children.append(instance)
 
-    return instance_list
+    return instance_node_list
 
 def is_volume_attached(volume):
     """ This function checks if a volume is attached
@@ -1,9 +1,14 @@
 # Standard libraries
+import io
+import csv
+import time
 import logging
-import threading
 # External libraries
 from botocore.exceptions import ClientError
 # Internal dependencies
+from libraries.Clients import get_client
+from libraries.Pagination import get_pages, get_items
+from libraries.Workers import WorkerPool
 from Model import Node
 
 ################
@@ -12,23 +17,41 @@ from Model import Node
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
+# Number of credential report generation checks and delay between them
+CREDENTIAL_REPORT_ATTEMPTS = 10
+CREDENTIAL_REPORT_DELAY = 2
+
 ##########################
 #### IAM Node Builder ####
 ##########################
 
+def get_iam_label(iam):
+    """ Returns the graphviz label of an iam node """
+    account = iam.father
+    account_identifier = account.json.get('Name')
+    if account_identifier is None:
+        account_identifier = 'account ' + account.id
+    return '"' + account_identifier + ' ' + iam.resource_type + '"'
+
 def create_iam_node(account):
     """ Builder for a iam node
     :param account: account father node
     :return: The bucket node
     """
-    resource_type = 'IAM'
-    account_identifier = account.json.get('Name')
-    if account_identifier is None:
-        account_identifier = 'account ' + account.id
-    label = '"' + account_identifier + ' ' + resource_type + '"'
     json = {'CustomId': account.id + '_IAM'}
-    return Node(json=json, resource_type=resource_type, id_type='CustomId',
-                color='goldenrod', label=label, father=account, service='iam')
+    return Node(json=json, resource_type='IAM', id_type='CustomId',
+                color='goldenrod', label=get_iam_label, father=account,
+                service='iam')
+
+def get_iam_resource_label(resource):
+    """ Returns the graphviz label of a group, role, user, policy
+        or inline policy node using its name
+    """
+    if resource.resource_type.endswith('Policy'):
+        name = resource.json.get('PolicyName')
+    else:
+        name = resource.json.get(resource.resource_type + 'Name')
+    return '"' + resource.resource_type + ' : ' + name + '"'
 
 def create_group_node(json, iam):
     """ Builder for a group node
@@ -36,10 +59,9 @@ def create_group_node(json, iam):
     :param iam: iam father node
     :return: the created group node
     """
-    resource_type = 'Group'
-    label = '"' + resource_type + ' : ' + json.get('GroupName') + '"'
-    return Node(json=json, resource_type=resource_type, id_type='Arn',
-                color='tomato', label=label, father=iam, service='iam')
+    return Node(json=json, resource_type='Group', id_type='Arn',
+                color='tomato', label=get_iam_resource_label, father=iam,
+                service='iam')
 
 def create_role_node(json, iam):
     """ Builder for a role node
@@ -47,10 +69,9 @@ def create_role_node(json, iam):
     :param iam: iam father node
     :return: the created role node
     """
-    resource_type = 'Role'
-    label = '"' + resource_type + ' : ' + json.get('RoleName') + '"'
-    return Node(json=json, resource_type=resource_type, id_type='Arn',
-                color='plum', label=label, father=iam, service='iam')
+    return Node(json=json, resource_type='Role', id_type='Arn',
+                color='plum', label=get_iam_resource_label, father=iam,
+                service='iam')
 
 def create_user_node(json, iam):
     """ Builder for a user node
@@ -58,10 +79,9 @@ def create_user_node(json, iam):
     :param iam: iam father node
     :return: the created user node
     """
-    resource_type = 'User'
-    label = '"' + resource_type + ' : ' + json.get('UserName') + '"'
-    return Node(json=json, resource_type=resource_type, id_type='Arn',
-                color='turquoise', label=label, father=iam, service='iam')
+    return Node(json=json, resource_type='User', id_type='Arn',
+                color='turquoise', label=get_iam_resource_label, father=iam,
+                service='iam')
 
 def create_policy_node(json, iam):
     """ Builder for a policy node
@@ -69,11 +89,10 @@ def create_policy_node(json, iam):
     :param iam: iam father node
     :return: the created user node
     """
-    resource_type = 'Policy'
-    label = '"' + resource_type + ' : ' + json.get('PolicyName') + '"'
     json['CustomId'] = json.get('Arn') + iam.father.id
-    return Node(json=json, resource_type=resource_type, id_type='CustomId',
-                color='limegreen', label=label, father=iam, service='iam')
+    return Node(json=json, resource_type='Policy', id_type='CustomId',
+                color='limegreen', label=get_iam_resource_label, father=iam,
+                service='iam')
 
 def create_inline_policy_node(json, resource_type, father):
     """ Builder for an inline policy node
@@ -89,9 +108,19 @@ def create_inline_policy_node(json, resource_type, father):
     if resource_type == 'UserPolicy':
         color = 'turquoise'
     json['CustomId'] = father.id + ' ' + resource_type + ' ' + json.get('PolicyName')
-    label = '"' + resource_type + ' : ' + json.get('PolicyName') + '"'
     return Node(json=json, resource_type=resource_type, id_type='CustomId',
-                color=color, label=label, father=father, service='iam')
+                color=color, label=get_iam_resource_label, father=father,
+                service='iam')
+
+def get_login_profile_label(login_profile):
+    """ Returns the graphviz label of a login profile node """
+    json = login_profile.json
+    if 'CreateDate' in json:
+        return ('"LoginProfile\nCreate Date : ' + format_date(json.get('CreateDate'))
+                + '\nPasswordResetRequired : ' + str(json.get('PasswordResetRequired')) + '"')
+    # Login profile from the credential report
+    return ('"LoginProfile\nPassword Last Changed : '
+            + format_date(json.get('PasswordLastChanged')) + '"')
 
 def create_login_profile_node(json, user):
     """ Builder for a login profile node
@@ -101,11 +130,14 @@ def create_login_profile_node(json, user):
     """
     resource_type = 'LoginProfile'
     json['CustomId'] = resource_type + ' ' + json.get('UserName') + ' ' + user.id
-    create_date = json.get('CreateDate').strftime("%Y-%m-%d %H:%M:%S")
-    label = ('"LoginProfile\nCreate Date : ' + create_date
-             + '\nPasswordResetRequired : ' + str(json.get('PasswordResetRequired')) + '"')
     return Node(json=json, resource_type=resource_type, id_type='CustomId',
-                color='turquoise', label=label, father=user, service='iam')
+                color='turquoise', label=get_login_profile_label, father=user,
+                service='iam')
+
+def get_mfa_device_label(mfa_device):
+    """ Returns the graphviz label of a mfa device node """
+    return ('"MFA Device\nUser : ' + mfa_device.json.get('UserName')
+            + '\nEnable Date : ' + format_date(mfa_device.json.get('EnableDate')) + '"')
 
 def create_mfa_device_node(json, user):
     """ Builder for a mfa device node
@@ -114,11 +146,19 @@ def create_mfa_device_node(json, user):
     :return: the created mfa device node
     """
     resource_type = 'MFADevice'
-    enable_date = json.get('EnableDate').strftime("%Y-%m-%d %H:%M:%S")
-    label = ('"MFA Device\nUser : ' + json.get('UserName')
-             + '\nEnable Date : ' + enable_date + '"')
-    return Node(json=json, resource_type=resource_type, id_type='SerialNumber',
-                color='turquoise', label=label, father=user, service='iam')
+    # The credential report does not give the device serial numbers
+    id_type = 'SerialNumber'
+    if json.get('SerialNumber') is None:
+        json['CustomId'] = resource_type + ' ' + json.get('UserName') + ' ' + user.id
+        id_type = 'CustomId'
+    return Node(json=json, resource_type=resource_type, id_type=id_type,
+                color='turquoise', label=get_mfa_device_label, father=user,
+                service='iam')
+
+def get_access_key_label(access_key):
+    """ Returns the graphviz label of an access key node """
+    return ('"Access Key\nUser : ' + access_key.json.get('UserName')
+            + '\nStatus : ' + access_key.json.get('Status') + '"')
 
 def create_access_key_node(json, user):
     """ Builder for an access key node
@@ -127,11 +167,15 @@ def create_access_key_node(json, user):
     :return: the created access key node
     """
     resource_type = 'AccessKey'
-    label = ('"Access Key\nUser : ' + json.get('UserName')
-             + '\nStatus : ' + json.get('Status') + '"')
+    # The credential report does not give the access key ids
+    id_type = resource_type + 'Id'
+    if json.get('AccessKeyId') is None:
+        json['CustomId'] = (resource_type + ' ' + json.get('UserName')
+                            + ' ' + str(json.get('KeyNumber')) + ' ' + user.id)
+        id_type = 'CustomId'
     return Node(json=json, resource_type=resource_type,
-                id_type=resource_type + 'Id', color='turquoise',
-                label=label, father=user, service='iam')
+                id_type=id_type, color='turquoise',
+                label=get_access_key_label, father=user, service='iam')
 
 # TODO def create_virtual_mfa_node
 
@@ -139,84 +183,103 @@ def create_access_key_node(json, user):
 #### SCAN ####
 ##############
 
-def fill_iam(session, account):
+def fill_iam(session, account, pool=None, workers=10,
+             credential_report=False):
     """ fill_iam take a boto3 session, an account node
         and add iam resources nodes as children nodes
+
+        The user login details are queried by a worker pool, it can be
+        shared by several accounts using the pool parameter, otherwise a pool
+        of the given number of workers is used for the account.
+        With the credential_report option they are read from the account
+        credential report instead, falling back to the per user queries
+        if the report is not available.
     """
     print '  Filling iam'
     # Creating the iam node to host iam resources
     iam = create_iam_node(account)
     account.children.append(iam)
-    iam_client = session.client('iam')
+    iam_client = get_client(session, 'iam', account_id=account.id)
     # Using the aws api "get_account_authorization_details" to get json
     # for most iam resources at once
+    group_details = []
+    role_details = []
+    user_details = []
+    policy_details = []
     try:
-        response = iam_client.get_account_authorization_details()
-        group_details = response.get('GroupDetailList')
-        role_details = response.get('RoleDetailList')
-        user_details = response.get('UserDetailList')
-        policy_details = response.get('Policies')
-        while response.get('Marker'):
-            response = iam_client.get_account_authorization_details(
-                Marker=response.get('Marker'))
-            group_details.extend(response.get('GroupDetailList'))
-            role_details.extend(response.get('RoleDetailList'))
-            user_details.extend(response.get('UserDetailList'))
-            policy_details.extend(response.get('Policies'))
+        for page in get_pages(iam_client, 'get_account_authorization_details'):
+            group_details.extend(page.get('GroupDetailList'))
+            role_details.extend(page.get('RoleDetailList'))
+            user_details.extend(page.get('UserDetailList'))
+            policy_details.extend(page.get('Policies'))
     except ClientError as client_error:
         # Getting the logger that is not shared in the multithreaded context
         # but is supposed to be thread safe
         logging.getLogger(__name__).warning(client_error)
         return
 
-    # Creating policies node list
-    attached_policy_list = []
+    # Creating the attached policies index by arn
+    # and the unattached policies node list
+    attached_policy_index = {}
     unattached_policy_list = []
 
     for policy_detail in policy_details:
-        if policy_detail.get('AttachmentCount') == '0':
-            policy = create_policy_node(json=policy_detail, iam=iam)
+        policy = create_policy_node(json=policy_detail, iam=iam)
+        # The attachment count is an integer in the API responses
+        if policy_detail.get('AttachmentCount') == 0:
             unattached_policy_list.append(policy)
         else:
-            policy = create_policy_node(json=policy_detail, iam=iam)
-            attached_policy_list.append(policy)
+            attached_policy_index[policy_detail.get('Arn')] = policy
 
-    # Using the json detail list and attached policy list
+    # Using the json detail list and attached policy index
     # to create the iam children nodes and their policy nodes
 
     group_list = fill_group_list(iam=iam, group_details=group_details,
-                                 iam_attached_policy_list=attached_policy_list)
+                                 iam_policy_index=attached_policy_index)
     fill_role_list(iam=iam, role_details=role_details,
-                   iam_attached_policy_list=attached_policy_list)
+                   iam_policy_index=attached_policy_index)
+    # The unattached policies are the iam detached policies children
+    iam.children.extend(unattached_policy_list)
+
+    # Indexing the groups by name to add the users to their groups
+    group_index = {group.json.get('GroupName'): group for group in group_list}
 
-    # this function use the session to query the user login details
+    # this function use the iam client to query the user login details
     # (mfa device, login profile and access keys)
-    fill_user_list(session=session, user_details=user_details,
-                   iam_attached_policy_list=attached_policy_list,
-                   group_list=group_list, iam=iam)
+    if pool is None:
+        account_pool = WorkerPool(workers)
+    else:
+        account_pool = pool
+    fill_user_list(pool=account_pool, iam_client=iam_client,
+                   user_details=user_details,
+                   iam_policy_index=attached_policy_index,
+                   group_index=group_index, iam=iam,
+                   credential_report=credential_report)
+    if pool is None:
+        account_pool.close()
 
 #####################################
 ## IAM Resources filling fonctions ##
 #####################################
 
-def fill_group_list(group_details, iam_attached_policy_list, iam):
+def fill_group_list(group_details, iam_policy_index, iam):
     """ This function takes an iam node, a group json list
-        and a list of attached policies """
+        and the attached policies index by arn """
     # Creating group node from json
     group_list = [create_group_node(json=group_detail, iam=iam)
                   for group_detail in group_details]
     for group in group_list:
         # Attaching managed policies
         attach_managed_policies(group.json.get('AttachedManagedPolicies'),
-                                iam_attached_policy_list, group)
+                                iam_policy_index, group)
         # Creating group policy node for the inline policies
         build_inline_policies(group)
     iam.children.extend(group_list)
     return group_list
 
-def fill_role_list(role_details, iam_attached_policy_list, iam):
+def fill_role_list(role_details, iam_policy_index, iam):
     """ This function takes an iam node, a role json list
-        and a list of attached policies
+        and the attached policies index by arn
     """
     # Creating role node from json
     role_list = [create_role_node(json=role_detail, iam=iam)
@@ -225,68 +288,63 @@ def fill_role_list(role_details, iam_attached_policy_list, iam):
     for role in role_list:
         # Attaching managed policies
         attach_managed_policies(role.json.get('AttachedManagedPolicies'),
-                                iam_attached_policy_list, role)
+                                iam_policy_index, role)
         # Creating role policy nodes for the inline policies
         build_inline_policies(role)
     iam.children.extend(role_list)
 
-def fill_user_list(session, user_details, group_list, iam_attached_policy_list,
-                   iam):
+def fill_user_list(pool, iam_client, user_details, group_index,
+                   iam_policy_index, iam, credential_report=False):
     """ Creating the user nodes from json adding them to the iam
-        and adding the login details to the users
+        and adding the login details to the users using the credential report
+        or the worker pool
     """
     # Creating user nodes from json
     user_list = [create_user_node(json=user_detail, iam=iam)
                  for user_detail in user_details]
-    threads = []
+    report = None
+    if credential_report and user_list != []:
+        report = get_credential_report(iam_client)
+    tasks = []
     for user in user_list:
         if user.json.get('GroupList') == []:
             # The ungrouped user are children of the iam node instead of the groups
             iam.children.append(user)
         else:
-            add_user_to_groups(user, group_list)
+            add_user_to_groups(user, group_index)
 
         attach_managed_policies(user.json.get('AttachedManagedPolicies'),
-                                iam_attached_policy_list, user)
+                                iam_policy_index, user)
 
         # Creating user policy nodes for the inline policies
         build_inline_policies(user)
 
-        # Using multithread to parallelize AWS API calls
-        thread = threading.Thread(target=add_login_detail_to_user,
-                                  args=(session, user))
-        thread.setDaemon(True)
-        threads.append(thread)
-        thread.start()
+        if report is None:
+            # Using the pool to parallelize AWS API calls, the client is shared
+            # by the workers since boto3 clients are thread safe
+            tasks.extend(add_login_detail_to_user(pool, iam_client, user))
 
-    for thread in threads:
-        # waithing for the threads before returning
-        while thread.isAlive():
-            thread.join()
+    if report is not None:
+        add_login_details_from_report(report, user_list)
+
+    # waithing for the user tasks before returning
+    pool.wait(tasks)
 
 ########################
 # Iam helper fonctions #
 ########################
 
-def attach_managed_policies(resource_policy_list, iam_policy_list, resource):
+def attach_managed_policies(resource_policy_list, iam_policy_index, resource):
     """ This function takes an iam resource, a json list (from authorization
     details api call) of its attached policies and the iam attached policy node
-    list to add the policy nodes to the resources childrens """
-    if resource_policy_list == []:
+    index by arn to add the policy nodes to the resources childrens """
+    if not resource_policy_list:
         return
-    # Extracting the arn as an unique identifier from the json policy list
-    # to build a set
-    resource_policy_arns = {
-        attached_policy['PolicyArn']
-        for attached_policy in resource_policy_list
-    }
-    # Filtering the iam policy node list by arn using the set
-    resource_attached_policy_nodes = [
-        policy_node for policy_node in iam_policy_list
-        if policy_node.json['Arn'] in resource_policy_arns
-    ]
-    # Adding the policies to the resource child list
-    resource.children.extend(resource_attached_policy_nodes)
+    # Getting the policy nodes from the index using their arn
+    for attached_policy in resource_policy_list:
+        policy_node = iam_policy_index.get(attached_policy['PolicyArn'])
+        if policy_node is not None:
+            resource.children.append(policy_node)
 
 def build_inline_policies(resource):
     """ Creating inline policy nodes for the iam resource """
@@ -301,24 +359,34 @@ def build_inline_policies(resource):
         ]
         resource.children.extend(inline_policy_list)
 
-def add_user_to_groups(user, group_list):
-    """ This function takes a user node and the iam group node list
+def add_user_to_groups(user, group_index):
+    """ This function takes a user node and the iam group node index by name
         and add the user nodes to the groups
     """
-    # Build a set of group names
-    group_names = {group_name for group_name in user.json['GroupList']}
-    # Use the set to user to group nodes from the list
-    for group in group_list:
-        if group.json['GroupName'] in group_names:
+    for group_name in user.json['GroupList']:
+        group = group_index.get(group_name)
+        if group is not None:
             group.children.append(user)
 
-def add_login_detail_to_user(session, user):
-    """ Adding the user login detail missing from
-    the iam client get_account_authorization_details API call"""
-    iam_client = session.client('iam')
-    add_login_profile_to_user(iam_client, user)
-    add_access_keys_to_user(iam_client, user)
-    add_mfa_devices_to_user(iam_client, user)
+def format_date(date):
+    """ Returns the label string of an API datetime or a credential report
+        date string, or unknown if the date is missing
+    """
+    if date is None:
+        return 'unknown'
+    if hasattr(date, 'strftime'):
+        return date.strftime("%Y-%m-%d %H:%M:%S")
+    return date.replace('T', ' ')[:19]
+
+def add_login_detail_to_user(pool, iam_client, user):
+    """ Submitting the queries of the user login detail missing from
+    the iam client get_account_authorization_details API call
+    and returning the submitted tasks"""
+    return [
+        pool.submit(add_login_profile_to_user, iam_client, user),
+        pool.submit(add_access_keys_to_user, iam_client, user),
+        pool.submit(add_mfa_devices_to_user, iam_client, user)
+    ]
 
 def add_login_profile_to_user(iam_client, user):
     """ Create the login profile node and adding it to the user node """
@@ -335,11 +403,8 @@ def add_login_profile_to_user(iam_client, user):
 
 def add_mfa_devices_to_user(iam_client, user):
     """ Adding mfa devices to user nodes """
-    response = iam_client.list_mfa_devices(UserName=user.json.get('UserName'))
-    mfa_device_list = response.get('MFADevices')
-    while response.get('IsTruncated'):
-        response = iam_client.list_mfa_devices(Marker=response.get('Marker'))
-        mfa_device_list.extend(response.get('MFADevices'))
+    mfa_device_list = get_items(iam_client, 'list_mfa_devices', 'MFADevices',
+                                UserName=user.json.get('UserName'))
     # Using list comprehension to transform the json list in a node list
     mfa_device_list = [
         create_mfa_device_node(json=mfa, user=user)
@@ -349,14 +414,83 @@ def add_mfa_devices_to_user(iam_client, user):
 
 def add_access_keys_to_user(iam_client, user):
     """ Adding access keys to user nodes """
-    response = iam_client.list_access_keys(UserName=user.json.get('UserName'))
-    access_key_list = response.get('AccessKeyMetadata')
-    while response.get('IsTruncated'):
-        response = iam_client.list_access_keys(Marker=response.get('Marker'))
-        access_key_list.extend(response.get('AccessKeyMetadata'))
+    access_key_list = get_items(iam_client, 'list_access_keys',
+                                'AccessKeyMetadata',
+                                UserName=user.json.get('UserName'))
     # Using list comprehension to transform the json list in a node list
     access_key_list = [
         create_access_key_node(json=key, user=user)
         for key in access_key_list
     ]
     user.children.extend(access_key_list)
+
+def get_credential_report(iam_client):
+    """ Returns the content of the account credential report, generating
+        it if there is no recent one, or None if it is not available
+    """
+    try:
+        for _ in range(CREDENTIAL_REPORT_ATTEMPTS):
+            # AWS API reuses the report generated in the last four hours
+            response = iam_client.generate_credential_report()
+            if response.get('State') == 'COMPLETE':
+                return iam_client.get_credential_report().get('Content')
+            time.sleep(CREDENTIAL_REPORT_DELAY)
+    except ClientError as client_error:
+        logging.getLogger(__name__).warning(client_error)
+        return None
+    logging.getLogger(__name__).warning(
+        'The credential report generation did not complete')
+    return None
+
+def get_report_value(row, column):
+    """ Returns a credential report value, None for the missing values """
+    value = row.get(column)
+    if value in (None, '', 'N/A', 'not_supported', 'no_information'):
+        return None
+    return value
+
+def add_login_details_from_report(report, user_list):
+    """ Adding the login profile, access key and mfa device nodes
+        to the user nodes using the rows of the credential report csv
+    """
+    user_index = {user.json.get('Arn'): user for user in user_list}
+    # The csv rows are parsed one at a time
+    for row in csv.DictReader(io.BytesIO(report)):
+        # The root account row has no user node
+        user = user_index.get(row.get('arn'))
+        if user is None:
+            continue
+        user_name = user.json.get('UserName')
+        if row.get('password_enabled') == 'true':
+            login_profile = {
+                'UserName': user_name,
+                'PasswordLastChanged': get_report_value(row, 'password_last_changed'),
+                'PasswordLastUsed': get_report_value(row, 'password_last_used'),
+                'PasswordNextRotation': get_report_value(row, 'password_next_rotation')
+            }
+            user.children.append(create_login_profile_node(json=login_profile,
+                                                           user=user))
+        for key_number in (1, 2):
+            prefix = 'access_key_' + str(key_number) + '_'
+            # A key that never existed has no rotation date
+            if get_report_value(row, prefix + 'last_rotated') is None:
+                continue
+            if row.get(prefix + 'active') == 'true':
+                status = 'Active'
+            else:
+                status = 'Inactive'
+            access_key = {
+                'UserName': user_name,
+                'KeyNumber': key_number,
+                'Status': status,
+                'LastRotated': get_report_value(row, prefix + 'last_rotated'),
+                'LastUsedDate': get_report_value(row, prefix + 'last_used_date'),
+                'LastUsedRegion': get_report_value(row, prefix + 'last_used_region'),
+                'LastUsedService': get_report_value(row, prefix + 'last_used_service')
+            }
+            user.children.append(create_access_key_node(json=access_key,
+                                                        user=user))
+        # The report only tells if the user has an active mfa device
+        if row.get('mfa_active') == 'true':
+            user.children.append(create_mfa_device_node(
+                json={'UserName': user_name}, user=user))
@@ -1,15 +1,137 @@
+# Standard libraries
+import logging
+import threading
+
+# Internal dependencies
+from libraries.Clients import get_client
+from libraries.Pagination import get_items
+from Traversal import traverse
+
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+####################
+ ### CHILD LIST ###
+####################
+
+class ChildList(object):
+    """ The child list of a node keeps the children in insertion order
+        for the traversals and also groups them by resource type
+        so that a typed lookup does not filter every child.
+
+        The children list is wrapped instead of subclassed, so every change
+        goes through the methods below and the resource type lists
+        are never stale.
+    """
+
+    __slots__ = ('_children', '_types')
+
+    def __init__(self, children=()):
+        self._children = []
+        # Children lists by resource type, rebuilt on first use
+        # when they are None (cf _reindex)
+        self._types = {}
+        self.extend(children)
+
+    def append(self, child):
+        self._children.append(child)
+        if self._types is not None:
+            self._types.setdefault(child.resource_type, []).append(child)
+
+    def extend(self, children):
+        for child in children:
+            self.append(child)
+
+    def __iadd__(self, children):
+        self.extend(children)
+        return self
+
+    def insert(self, index, child):
+        self._children.insert(index, child)
+        self._types = None
+
+    def remove(self, child):
+        self._children.remove(child)
+        self._types = None
+
+    def pop(self, index=-1):
+        child = self._children.pop(index)
+        self._types = None
+        return child
+
+    def get_type(self, resource_type):
+        """ Returns the children of the resource type in insertion order """
+        if self._types is None:
+            self._reindex()
+        return self._types.get(resource_type, [])
+
+    def _reindex(self):
+        """ Rebuilding the resource type lists after a removal,
+            an insertion in the middle of the list or an unpickling
+        """
+        self._types = {}
+        for child in self._children:
+            self._types.setdefault(child.resource_type, []).append(child)
+
+    def __iter__(self):
+        return iter(self._children)
+
+    def __len__(self):
+        return len(self._children)
+
+    def __getitem__(self, index):
+        """ Returns a child, or a plain list of children for a slice """
+        return self._children[index]
+
+    def __contains__(self, child):
+        return child in self._children
+
+    def __eq__(self, other):
+        if isinstance(other, ChildList):
+            other = other._children
+        return self._children == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    # Mutable like a list
+    __hash__ = None
+
+    def __repr__(self):
+        return 'ChildList(' + repr(self._children) + ')'
+
+    def __reduce__(self):
+        """ Pickling the child list as its children, the resource type lists
+            are rebuilt on first use since a shared child (like a trail bucket)
+            can be unpickled after the child lists holding it
+        """
+        return (ChildList, (), self._children)
+
+    def __setstate__(self, children):
+        """ Restores the children of an unpickled child list """
+        self._children = children
+        self._types = None
+
 ##############
  ### NODE ###
 ##############
 
 # Every AWS resources will be instances of the node class
 
-class Node:
+class Node(object):
     """ The node is the base of the model used in aws-graph.
         All the aws resources are node class instanciated using different nodes
         builders.
+
+        The nodes use slots instead of a per instance dictionary and their
+        graphviz strings are only built when a graphviz output needs them,
+        the builders give a label function called on the first access
+        to the label instead of the label string.
     """
 
+    __slots__ = ('resource_type', 'id_type', 'id', 'json', '_generation',
+                 'children', 'father', 'ancestors', 'service', 'color',
+                 '_label', '_identifier', '_style')
+
     def __init__(self, json, resource_type, id_type, color='white',
                  label=None, father=None, service=None, ancestors=[]):
         self.resource_type = resource_type
@@ -20,75 +142,238 @@ class Node:
         #self.methods = []
             # the methods atribute may be used to give a fonction to every node
             # on creation, like a delete function
-        # Used to check if the node has been visited in a graph traversal
-        self._marked = False
-        # List of the children node of the node, can be empty
-        self.children = []
+        # Generation of the last graph traversal that visited the node
+        # (cf Traversal.py)
+        self._generation = 0
+        # List of the children node of the node grouped by resource type,
+        # can be empty
+        self.children = ChildList()
         # The main anscestor of the node
         self.father = father
         # List of the node anscestors, almost unused for now
         self.ancestors = ancestors
         # Define which to aws service the node belongs, almost unused for now
         self.service = service
-        # The graphviz unique identifier for the node
-        self.identifier = '"' + self.resource_type + ' ' + self.id + '"'
-        # The graphviz label for the node
-        if label is None:
-            self.label = '"' + self.resource_type + '\n' + self.id + '"'
-        else:
-            self.label = label
-        # The graphviz style for the node
-        self.style = '[fillcolor=' + color +', label=' + self.label + ']'
+        # The graphviz fill color of the node
+        self.color = color
+        # The function building the graphviz label given by the builder,
+        # replaced by the label on first access (cf label)
+        self._label = label
+        # The graphviz identifier and style are built on first access
+        self._identifier = None
+        self._style = None
+        # Indexing the node for the joins between resources
+        registry.register(self)
+
+    @property
+    def identifier(self):
+        """ The graphviz unique identifier for the node """
+        if self._identifier is None:
+            self._identifier = '"' + self.resource_type + ' ' + self.id + '"'
+        return self._identifier
+
+    @property
+    def label(self):
+        """ The graphviz label for the node, built on first access by the
+            label function of the builder or the default label
+        """
+        if not isinstance(self._label, basestring):
+            if self._label is None:
+                self._label = '"' + self.resource_type + '\n' + self.id + '"'
+            else:
+                self._label = self._label(self)
+        return self._label
+
+    @property
+    def style(self):
+        """ The graphviz style for the node """
+        if self._style is None:
+            self._style = ('[fillcolor=' + self.color
+                           + ', label=' + self.label + ']')
+        return self._style
+
+    def __getstate__(self):
+        """ Returns the slots values to pickle the node
+            (cf scan_in_processes)
+        """
+        return dict((slot, getattr(self, slot)) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        """ Restores the slots values of an unpickled node """
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def release_children(self):
+        """ Dropping the children of the node, their subtrees
+            can then be garbage collected
+        """
+        self.children = ChildList()
 
     def get_child_list(self, resource_type):
         """ Return a list from the node children filtered by resource_type """
-        return [child for child in self.children
-                if child.resource_type == resource_type]
+        return list(self.children.get_type(resource_type))
+
+    def get_grandchild_list(self, child_type, resource_type):
+        """ Return the list of the resource_type children of the child_type
+            children of the node, like the subnets of a region vpcs
+        """
+        return [grandchild
+                for child in self.children.get_type(child_type)
+                for grandchild in child.children.get_type(resource_type)]
 
     def print_graphviz(self, subgraph, max_depth=-1):
         """ This function do a traversal of the node and its children
             to build a graphviz graph by filling the subgraph str array
             cf graph traversal
         """
-        # The marked attribute shows if the node has been processed yet
-        if self._marked or max_depth == 0:
-            return
-        self._marked = True
-        # Adding the node to the graph
-        subgraph.append(self.identifier + ' ' + self.style)
-        # The max depth attribute can limit be used
-        # to limit the depth of the resulting graph
-        if self.children != [] and max_depth != 1:
-            for child in self.children:
-                # Adding each child to the graph
-                child.print_graphviz(subgraph, max_depth - 1)
-                # And drawing the edges toward them
-                subgraph.append(self.identifier + ' -> ' + child.identifier)
+        traverse(
+            [self], max_depth=max_depth,
+            # Adding the node to the graph
+            pre_order=lambda node: subgraph.append(
+                node.identifier + ' ' + node.style),
+            # And drawing the edges toward the children
+            edge=lambda father, child: subgraph.append(
+                father.identifier + ' -> ' + child.identifier)
+        )
 
     def print_json(self, node_list, max_depth=-1):
         """ This function do a traversal of the node and its children
-            to build a graphviz graph by filling the subgraph str array
+            to fill the node_list with the json of the nodes
             cf graph traversal
         """
-        # The marked attribute shows if the node has been processed yet
-        if self._marked or max_depth == 0:
+        traverse(
+            [self], max_depth=max_depth,
+            pre_order=lambda node: node_list.append(
+                {node.resource_type : node.json})
+        )
+
+################
+### REGISTRY ###
+################
+
+class NodeRegistry(object):
+    """ The registry indexes every node by resource type and id
+        to join the resources using hash lookups instead of list searches.
+        The ids are scoped by account since a resource (like a shared subnet)
+        can be seen from several accounts, the indexes of an account are
+        dropped at once when the account is released.
+
+        The nodes without account (like an instance without subnet, left out
+        of the tree) can not be looked up and are not indexed.
+    """
+
+    # Resource types seen several times in an account (a multi region trail,
+    # a bucket of a trail and of the bucket list), their nodes are merged
+    # by the builders (cf canonicalize)
+    SHARED_TYPES = ('Cloudtrail', 'Bucket')
+
+    def __init__(self):
+        # Nodes by (resource type, id) by account id
+        self._nodes = {}
+        # Node lists by resource type by account id
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def register(self, node):
+        """ Adding a node to the indexes, the first node registered with an
+            account, type and id is the canonical node of the resource and
+            the following ones are left out of the indexes (cf canonicalize),
+            they are logged unless their resource type is a shared one
+        """
+        account_id = get_account_id(node)
+        if account_id is None:
             return
-        self._marked = True
-        # Adding the node to the graph
-        node_list.append({self.resource_type : self.json})
-        # The max depth attribute can limit be used
-        # to limit the depth of the resulting graph
-        if self.children != [] and max_depth != 1:
-            for child in self.children:
-                # Adding each child to the graph
-                child.print_json(node_list, max_depth - 1)
-
-    #def unmark_nodes ?
+        key = (node.resource_type, node.id)
+        with self._lock:
+            if key not in self._nodes.get(account_id, {}):
+                self._add(account_id, key, node)
+                return
+        if node.resource_type not in self.SHARED_TYPES:
+            logging.getLogger(__name__).warning(
+                node.resource_type + ' ' + str(node.id) + ' of account '
+                + str(account_id) + ' is already registered, the duplicate'
+                ' node is not indexed')
+
+    def canonicalize(self, node):
+        """ Returns the canonical node of the resource of the node so a
+            resource reached from several places is a single node,
+            the json fields missing from the canonical node (like the ones
+            of an incomplete placeholder node) are merged from the node
+        """
+        account_id = get_account_id(node)
+        if account_id is None:
+            return node
+        key = (node.resource_type, node.id)
+        with self._lock:
+            canonical = self._nodes.get(account_id, {}).get(key)
+            if canonical is None:
+                self._add(account_id, key, node)
+                canonical = node
+            elif canonical is not node:
+                for field, value in node.json.items():
+                    canonical.json.setdefault(field, value)
+        return canonical
+
+    def _add(self, account_id, key, node):
+        """ Adding the node to the account indexes, the lock must be held """
+        self._nodes.setdefault(account_id, {})[key] = node
+        self._types.setdefault(account_id, {}).setdefault(
+            node.resource_type, []).append(node)
+
+    def get(self, account_id, resource_type, node_id):
+        """ Returns the node of the account with the type and the id
+            or None if it is not registered
+        """
+        return self._nodes.get(account_id, {}).get((resource_type, node_id))
+
+    def get_type(self, resource_type):
+        """ Returns the list of the nodes of the resource type """
+        with self._lock:
+            return [node
+                    for account_types in self._types.values()
+                    for node in account_types.get(resource_type, [])]
+
+    def release_account(self, account_id):
+        """ Dropping the indexes of an account, so its nodes can be
+            garbage collected once the account is exported
+        """
+        with self._lock:
+            self._nodes.pop(account_id, None)
+            self._types.pop(account_id, None)
+
+    def clear(self):
+        """ Removing every node from the registry """
+        with self._lock:
+            self._nodes.clear()
+            self._types.clear()
+
+# The registry shared by every node builder
+registry = NodeRegistry()
 
 ###############
 ### Helpers ###
 ###############
 
+def get_account_id(node):
+    """ Returns the id of the account node the node belongs to
+        using its father chain, or None for a node without account
+    """
+    while node is not None and node.resource_type != 'Account':
+        node = node.father
+    if node is None:
+        return None
+    return node.id
+
+def get_region(node):
+    """ Returns the region of the nearest region node of the node
+        father chain, or None for a node outside of any region
+    """
+    while node is not None and node.resource_type != 'Region':
+        node = node.father
+    if node is None:
+        return None
+    return node.json.get('Region')
+
 
 def get_name_from_tags(tags):
     """ Used in network and ec2 services to get the tag name if it exists """
@@ -103,21 +388,31 @@ def get_name_from_tags(tags):
  ### NODE Builders ###
 ######################
 
+def get_account_label(account):
+    """ Returns the graphviz label of an account node """
+    if account.json.get('Name'):
+        return ('"' + account.resource_type
+                + '\n' + account.json.get('Name')
+                + '\n' + account.id + '"')
+    return '"' + account.resource_type + '\n' + account.id + '"'
+
 def create_account_node(json):
     """ Builder for a account node
     :param json: json from aws api
     :return: The account node
     """
-    resource_type = 'Account'
-    if json.get('Name'):
-        label = ('"' + resource_type
-                 + '\n' + json.get('Name')
-                 + '\n' + json.get('Id') + '"')
-    else:
-        label = ('"' + resource_type
-                 + '\n' + json.get('Id') + '"')
-    return Node(json=json, resource_type=resource_type,
-                id_type='Id', color='gold', label=label)
+    return Node(json=json, resource_type='Account',
+                id_type='Id', color='gold', label=get_account_label)
+
+def get_region_label(region_node):
+    """ Returns the graphviz label of a region node """
+    account = region_node.father
+    account_identifier = account.json.get('Name')
+    if account_identifier is None:
+        account_identifier = 'account ' + account.id
+    return ('"' + region_node.resource_type
+            + '\n' + account_identifier
+            + '\n' + region_node.json.get('Region') + '"')
 
 def create_region_node(account, region):
     """ Builder for a region node
@@ -125,18 +420,17 @@ def create_region_node(account, region):
     :param region: aws region of the node
     :return: The region node
     """
-    resource_type = 'Region'
-    account_identifier = account.json.get('Name')
-    if account_identifier is None:
-        account_identifier = 'account ' + account.id
-    label = ('"' + resource_type
-             + '\n' + account_identifier
-             + '\n' + region + '"')
     json = {'CustomId': account.id + '_' + region}
     json['Region'] = region
-    return Node(json=json, resource_type=resource_type,
+    return Node(json=json, resource_type='Region',
                 id_type='CustomId', color='paleturquoise',
-                label=label, father=account, service='region')
+                label=get_region_label, father=account, service='region')
+
+def get_cloudtrail_label(trail):
+    """ Returns the graphviz label of a cloudtrail node """
+    return ('"' + trail.resource_type + '\n' + trail.json.get('Name')
+            + '\nMultiRegion : ' + str(trail.json.get('IsMultiRegionTrail'))
+            + '"')
 
 def create_cloudtrail_node(json, region_node):
     """ Builder for a cloudtrail node
@@ -144,12 +438,10 @@ def create_cloudtrail_node(json, region_node):
     :param region_node: region father node
     :return: The cloudtrail node
     """
-    resource_type = 'Cloudtrail'
-    label = ('"' + resource_type + '\n' + json.get('Name') +
-             '\nMultiRegion : ' + str(json.get('IsMultiRegionTrail')) + '"')
-    return Node(json=json, resource_type=resource_type,
+    return Node(json=json, resource_type='Cloudtrail',
                 id_type='TrailARN', color='mediumspringgreen',
-                label=label, father=region_node, service='cloudtrail')
+                label=get_cloudtrail_label, father=region_node,
+                service='cloudtrail')
 
 def create_bucket_node(json, account):
     """ Builder for a bucket node
@@ -179,28 +471,43 @@ def fill_cloudtrail(session, region_node):
     """
     print '  Filling cloudtrail'
     region = region_node.json.get('Region')
-    cloudtrail_client = session.client('cloudtrail', region_name=region)
-    cloudtrail_json_list = cloudtrail_client.describe_trails().get('trailList')
-    cloudtrail_node_list = [
-        create_cloudtrail_node(json=trail, region_node=region_node)
-        for trail in cloudtrail_json_list
-    ]
-    # The buckets are not necessarily in the same aws account as the cloudtrail
-    # We create incomplete bucket node list as cloudtrail children list to draw
-    # the edges toward the buckets nodes
-    for trail in cloudtrail_node_list:
+    cloudtrail_client = get_client(session, 'cloudtrail', region,
+                                   account_id=region_node.father.id)
+    cloudtrail_json_list = get_items(cloudtrail_client, 'describe_trails',
+                                     'trailList')
+    # The multi region trails are returned in every region, they are
+    # attached to their home region so that their father is the region
+    # they are drawn in, or to the first region scanned if their home
+    # region is not scanned
+    scanned_regions = set(scanned_region.json.get('Region') for scanned_region
+                          in region_node.father.get_child_list('Region'))
+    cloudtrail_node_list = []
+    for trail_json in cloudtrail_json_list:
+        home_region = trail_json.get('HomeRegion', region)
+        if home_region != region and home_region in scanned_regions:
+            continue
+        trail = create_cloudtrail_node(json=trail_json, region_node=region_node)
+        if registry.canonicalize(trail) is not trail:
+            # Already attached to another region
+            continue
+        # The buckets are not necessarily in the same aws account as the
+        # cloudtrail, we create incomplete bucket nodes as cloudtrail
+        # children to draw the edges toward the buckets nodes, they are
+        # merged with the bucket nodes of the account if they exist
         json = {"Name":trail.json.get('S3BucketName')}
         bucket = create_bucket_node(json=json, account=region_node.father)
-        trail.children.append(bucket)
+        trail.children.append(registry.canonicalize(bucket))
+        cloudtrail_node_list.append(trail)
     region_node.children.extend(cloudtrail_node_list)
 
 def fill_s3(session, account):
     """ fill_s3 takes an account node and a boto3 session
     and add a s3 bucket node list as child list to the account"""
     print '  Filling s3'
-    s3_client = session.client('s3')
+    s3_client = get_client(session, 's3', account_id=account.id)
+    # The buckets may already have an incomplete node built by fill_cloudtrail
     bucket_list = [
-        create_bucket_node(json=bucket, account=account)
-        for bucket in s3_client.list_buckets().get('Buckets')
+        registry.canonicalize(create_bucket_node(json=bucket, account=account))
+        for bucket in get_items(s3_client, 'list_buckets', 'Buckets')
     ]
     account.children.extend(bucket_list)
@@ -1,60 +1,87 @@
 # Internal dependencies
-from Model import Node
-from Network import fill_network
+from libraries.Clients import get_client
+from libraries.Pagination import get_items
+from Model import Node, get_account_id, registry
 
 ##########################
 #### RDS Node Builder ####
 ##########################
 
+def get_db_instance_label(db_instance):
+    """ Returns the graphviz label of a db instance node """
+    name = ''
+    if db_instance.json.get('DBName'):
+        name = db_instance.json.get('DBName')
+    return ('"' + db_instance.resource_type + '\n' + name
+            + '\n Status' + db_instance.json.get('DBInstanceStatus')
+            + '\n Engine' + db_instance.json.get('Engine') + '"')
+
 def create_db_instance_node(json, vpc):
     """ Builder for a db instance node
     :param json: json from AWS API
     :param vpc: vpc father node
     :return: The db instance node
     """
-    resource_type = 'DBInstance'
-    name = ''
-    if json.get('DBName'):
-        name = json.get('DBName')
-    label = ('"' + resource_type + '\n' + name
-             + '\n Status' + json.get('DBInstanceStatus')
-             + '\n Engine' + json.get('Engine') + '"')
-    return Node(json=json, resource_type=resource_type,
+    return Node(json=json, resource_type='DBInstance',
                 id_type='DBInstanceIdentifier', color='aquamarine',
-                label=label, father=vpc, service='rds')
+                label=get_db_instance_label, father=vpc, service='rds')
 
 ##############
 #### SCAN ####
 ##############
 
-def fill_rds(session, region_node):
+def fill_rds(session, region_node, filters=None):
     """ fill_rds take a boto3 session, a region node
-        and add rds instances nodes to the vpcs nodes
+        and add rds instances nodes to the vpcs nodes,
+        the region network nodes must be filled beforehand
+        (cf fill_network_from_snapshot), the db instances are selected using the optional tag filters
     """
-    # Verifying that network is filled
     vpc_list = region_node.get_child_list('Vpc')
-    if vpc_list == []:
-        fill_network(session, region_node)
-        vpc_list = region_node.get_child_list('Vpc')
 
     print '  Filling rds'
 
     region = region_node.json.get('Region')
-    db_instance_list = get_db_instance_lists(session=session, region=region)
+    db_instance_list = get_db_instance_lists(session=session, region=region,
+                                             filters=filters,
+                                             account_id=region_node.father.id)
 
-    if db_instance_list != []:
+    if db_instance_list != [] and vpc_list != []:
         add_db_instances_to_vpcs(vpc_list, db_instance_list)
 
-def get_db_instance_lists(session, region):
+def get_db_instance_lists(session, region, filters=None, account_id=None):
     """ Call boto3 api using the session to get the database instance list """
-    db_instance_list = []
-    rds_client = session.client('rds', region_name=region)
-    response = rds_client.describe_db_instances()
-    db_instance_list.extend(response.get('DBInstances'))
-    while response.get('Marker'):
-        response = rds_client.describe_db_instances(Marker=response.get('Marker'))
-        db_instance_list.extend(response.get('DBInstances'))
-    return db_instance_list
+    rds_client = get_client(session, 'rds', region, account_id=account_id)
+    db_instance_list = get_items(rds_client, 'describe_db_instances',
+                                 'DBInstances')
+    if not filters:
+        return list(db_instance_list)
+    # The describe_db_instances filters do not support the tags,
+    # the tag filters are applied to the TagList of the db instances
+    return [db_instance for db_instance in db_instance_list
+            if has_tags(get_db_instance_tags(rds_client, db_instance),
+                        filters)]
+
+def get_db_instance_tags(rds_client, db_instance):
+    """ Returns the db instance json with its TagList, the older API
+        versions do not return the TagList with the db instances so it is
+        then loaded with one list_tags_for_resource call by db instance
+    """
+    if 'TagList' not in db_instance:
+        db_instance['TagList'] = rds_client.list_tags_for_resource(
+            ResourceName=db_instance['DBInstanceArn']).get('TagList', [])
+    return db_instance
+
+def has_tags(json, filters):
+    """ Checks if the TagList of a json matches the tag filters """
+    if not filters:
+        return True
+    tags = {tag.get('Key'): tag.get('Value')
+            for tag in json.get('TagList') or []}
+    for tag_filter in filters:
+        tag_key = tag_filter['Name'][len('tag:'):]
+        if tags.get(tag_key) not in tag_filter['Values']:
+            return False
+    return True
 
 def add_db_instances_to_vpcs(vpc_list, db_instance_list):
     """ The function takes the region vpc node list and the database instance
@@ -67,23 +94,10 @@ def add_db_instances_to_vpcs(vpc_list, db_instance_list):
         else:
             db_instance['VpcId'] = db_instance.get('DBSubnetGroup').get('VpcId')
 
-    # Sorting the instance list to avoid the search
-    # when several instances are in the same vpc
-    db_instance_list = sorted(
-        db_instance_list,
-        key=lambda db_instance: db_instance.get('VpcId')
-    )
-
-    # Initializing loop variable
-    vpc = vpc_list[0]
+    account_id = get_account_id(vpc_list[0])
     for db_instance in db_instance_list:
-        if vpc.id != db_instance.get('VpcId'):
-            # Getting the vpc of the current instance
-            # that may be shared by the next instances in the list
-            vpc = next((vpc for vpc in vpc_list
-                        if vpc.id == db_instance['VpcId']),
-                       None)
-
+        # Getting the vpc of the current instance from the registry
+        vpc = registry.get(account_id, 'Vpc', db_instance.get('VpcId'))
         db_instance = create_db_instance_node(json=db_instance, vpc=vpc)
         if vpc is not None:
             vpc.children.append(db_instance)
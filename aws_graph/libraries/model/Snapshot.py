@@ -0,0 +1,56 @@
+# Internal dependencies
+from libraries.Clients import get_client
+from Network import get_vpc_list, get_subnet_list, build_network
+from EC2 import get_active_instance_list, get_volume_list, build_ec2
+
+###########################
+#### REGIONAL SNAPSHOT ####
+###########################
+
+# The describe call loading each json list of the snapshot
+SNAPSHOT_CALLS = {
+    'Vpcs': get_vpc_list,
+    'Subnets': get_subnet_list,
+    'Instances': get_active_instance_list,
+    'Volumes': get_volume_list,
+}
+
+class RegionSnapshot(object):
+    """ The regional snapshot holds the json lists of the vpcs, subnets,
+        instances and volumes of a region. Each list is loaded by its own
+        describe call so that the calls can run concurrently on the region
+        ec2 client (cf schedule_scan), the network and ec2 nodes are then
+        built from the lists.
+    """
+
+    def __init__(self, session, region_node, filters=None):
+        self.session = session
+        self.region_node = region_node
+        self.filters = filters
+        self._lists = {}
+
+    def load(self, resource_list):
+        """ Loading a json list of the snapshot (Vpcs, Subnets,
+            Instances or Volumes) with its describe call
+        """
+        ec2_client = get_client(self.session, 'ec2',
+                                self.region_node.json.get('Region'),
+                                account_id=self.region_node.father.id)
+        self._lists[resource_list] = SNAPSHOT_CALLS[resource_list](
+            ec2_client, self.filters)
+
+    def get(self, resource_list):
+        """ Returns a loaded json list of the snapshot """
+        return self._lists.get(resource_list, [])
+
+def fill_network_from_snapshot(snapshot):
+    """ Building the region network nodes from the loaded snapshot """
+    build_network(snapshot.region_node, snapshot.get('Vpcs'),
+                  snapshot.get('Subnets'))
+
+def fill_ec2_from_snapshot(snapshot):
+    """ Building the region ec2 nodes from the loaded snapshot,
+        the region network nodes must be built beforehand
+    """
+    build_ec2(snapshot.region_node, snapshot.get('Instances'),
+              snapshot.get('Volumes'))
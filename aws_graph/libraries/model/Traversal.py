@@ -0,0 +1,84 @@
+# Standard libraries
+import threading
+
+###################
+#### TRAVERSAL ####
+###################
+
+# Every traversal uses a new generation number, a node is visited
+# in a traversal if its generation is the traversal generation,
+# so the traversals never need to unmark the nodes
+_generation = 0
+_lock = threading.Lock()
+# Marks the end of a children iterator
+_END = object()
+
+def new_generation():
+    """ Returns a generation number never used by a previous traversal """
+    global _generation
+    with _lock:
+        _generation += 1
+        return _generation
+
+def traverse(roots, max_depth=-1, pre_order=None, post_order=None, edge=None):
+    """
+    traverse does a depth first traversal of the nodes reachable from the
+    roots using an explicit stack, every node is visited once even if it is
+    the child of several nodes.
+
+    Parameters
+    ----------
+    roots : [node]
+        the nodes the traversal starts from, sharing the visited nodes
+    max_depth : int
+        maximum depth of the visited nodes, the roots depth being 1,
+        a negative value means no limit
+    pre_order : function(node)
+        called when a node is visited, before its children
+    post_order : function(node)
+        called after the traversal of a node children
+    edge : function(father, child)
+        called for every edge between a visited node and its children
+        once the child has been traversed, including the already visited
+        children
+    """
+    generation = new_generation()
+    for root in roots:
+        if root._generation == generation or max_depth == 0:
+            continue
+        root._generation = generation
+        if pre_order is not None:
+            pre_order(root)
+        if max_depth == 1:
+            if post_order is not None:
+                post_order(root)
+            continue
+        # The stack holds (node, remaining depth, children iterator) tuples
+        stack = [(root, max_depth, iter(root.children))]
+        while stack:
+            node, depth, children = stack[-1]
+            child = next(children, _END)
+            if child is _END:
+                # The node children are all traversed
+                stack.pop()
+                if post_order is not None:
+                    post_order(node)
+                if stack and edge is not None:
+                    edge(stack[-1][0], node)
+                continue
+            child_depth = depth - 1
+            if child._generation == generation or child_depth == 0:
+                if edge is not None:
+                    edge(node, child)
+                continue
+            child._generation = generation
+            if pre_order is not None:
+                pre_order(child)
+            if child_depth == 1 or not child.children:
+                # The child is a leaf of the traversal
+                if post_order is not None:
+                    post_order(child)
+                if edge is not None:
+                    edge(node, child)
+            else:
+                stack.append((child, child_depth, iter(child.children)))
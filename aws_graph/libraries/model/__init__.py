@@ -1,5 +1,7 @@
 from Model import Node, create_account_node, fill_region, fill_cloudtrail, fill_s3
+from Model import NodeRegistry, registry, get_account_id, get_region
+from Traversal import traverse
 from IAM import fill_iam
-from EC2 import fill_ec2
 from RDS import fill_rds
-from Network import fill_network
+from Snapshot import RegionSnapshot
+from Snapshot import fill_network_from_snapshot, fill_ec2_from_snapshot
@@ -8,6 +8,9 @@ setup(name='aws-graph',
           'boto3',
           'graphviz',
       ],
+      extras_require={
+          'gevent': ['gevent'],
+      },
       scripts=['aws_graph.py'],
       entry_points={
           'console_scripts': ['aws-graph=aws_graph:main'],
@@ -0,0 +1,55 @@
+import unittest
+
+from botocore.exceptions import ClientError
+
+from libraries.Connect import get_account_list_from_units
+
+class FakeOrganizationsClient(object):
+    """ organizations client of an organization with the units
+        ou-1 (holding ou-2 and ou-3) and ou-4
+    """
+
+    CHILDREN = {'ou-1': ['ou-2', 'ou-3'], 'ou-3': ['ou-5']}
+    ACCOUNTS = {'ou-1': ['111'], 'ou-2': ['222', '333'], 'ou-3': [],
+                'ou-4': ['444'], 'ou-5': ['555']}
+
+    def __init__(self, failing_unit=None):
+        self.failing_unit = failing_unit
+
+    def can_paginate(self, operation):
+        return False
+
+    def list_children(self, ParentId, ChildType):
+        return {'Children': [{'Id': unit_id, 'Type': ChildType}
+                             for unit_id in self.CHILDREN.get(ParentId, [])]}
+
+    def list_accounts_for_parent(self, ParentId):
+        if ParentId == self.failing_unit:
+            raise ClientError({'Error': {'Code': 'AccessDenied'}},
+                              'ListAccountsForParent')
+        return {'Accounts': [{'Id': account_id}
+                             for account_id in self.ACCOUNTS[ParentId]]}
+
+class AccountListFromUnitsTest(unittest.TestCase):
+    """ Tests of the organizational units walk """
+
+    def test_accounts_of_the_units_and_their_descendants(self):
+        account_list = get_account_list_from_units(
+            FakeOrganizationsClient(), ['ou-1'], 3)
+        self.assertEqual([account['Id'] for account in account_list],
+                         ['111', '222', '333', '555'])
+
+    def test_accounts_listed_once(self):
+        # ou-3 is also a descendant of ou-1
+        account_list = get_account_list_from_units(
+            FakeOrganizationsClient(), ['ou-4', 'ou-3', 'ou-1'], 3)
+        self.assertEqual([account['Id'] for account in account_list],
+                         ['111', '222', '333', '444', '555'])
+
+    def test_failed_walk_raises(self):
+        with self.assertRaises(ClientError):
+            get_account_list_from_units(
+                FakeOrganizationsClient(failing_unit='ou-5'), ['ou-1'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
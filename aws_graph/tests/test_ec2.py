@@ -0,0 +1,46 @@
+import unittest
+
+from libraries.model import Node, create_account_node, registry
+from libraries.model.Model import create_region_node
+from libraries.model.EC2 import build_ec2
+
+VOLUMES = [
+    {'VolumeId': 'vol-1', 'Attachments': [{'InstanceId': 'i-1',
+                                           'State': 'attached'}]},
+    {'VolumeId': 'vol-2', 'Attachments': []},
+]
+
+class BuildEc2Test(unittest.TestCase):
+    """ Tests of the ec2 nodes built from the region snapshot lists """
+
+    def setUp(self):
+        registry.clear()
+        account = create_account_node(json={'Id': '123'})
+        self.region = create_region_node(account, 'eu-west-1')
+        vpc = Node(json={'VpcId': 'vpc-1'}, resource_type='Vpc',
+                   id_type='VpcId', father=self.region)
+        self.region.children.append(vpc)
+        self.subnet = Node(json={'SubnetId': 'subnet-1'},
+                           resource_type='Subnet', id_type='SubnetId',
+                           father=vpc)
+        vpc.children.append(self.subnet)
+
+    def tearDown(self):
+        registry.clear()
+
+    def test_instances_and_volumes(self):
+        build_ec2(self.region, [{'InstanceId': 'i-1',
+                                 'SubnetId': 'subnet-1'}], VOLUMES)
+        instances = self.subnet.get_child_list('Instance')
+        self.assertEqual([instance.id for instance in instances], ['i-1'])
+        self.assertEqual([volume.id for volume
+                          in instances[0].get_child_list('Volume')], ['vol-1'])
+        self.assertEqual([volume.id for volume
+                          in self.region.get_child_list('Volume')], ['vol-2'])
+
+    def test_no_volumes_without_instances(self):
+        build_ec2(self.region, [], VOLUMES)
+        self.assertEqual(self.region.get_child_list('Volume'), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import libraries.model.IAM as IAM
+from libraries.model import Node
+from libraries.model.IAM import add_login_details_from_report
+from libraries.model.IAM import get_credential_report
+
+# Credential report columns
+HEADER = ('user,arn,user_creation_time,password_enabled,password_last_used,'
+          'password_last_changed,password_next_rotation,mfa_active,'
+          'access_key_1_active,access_key_1_last_rotated,'
+          'access_key_1_last_used_date,access_key_1_last_used_region,'
+          'access_key_1_last_used_service,access_key_2_active,'
+          'access_key_2_last_rotated,access_key_2_last_used_date,'
+          'access_key_2_last_used_region,access_key_2_last_used_service,'
+          'cert_1_active,cert_1_last_rotated,cert_2_active,cert_2_last_rotated')
+
+REPORT = '\n'.join([
+    HEADER,
+    '<root_account>,arn:aws:iam::123:root,2017-01-01T00:00:00+00:00,'
+    'not_supported,2017-06-01T00:00:00+00:00,not_supported,not_supported,'
+    'true,false,N/A,N/A,N/A,N/A,false,N/A,N/A,N/A,N/A,false,N/A,false,N/A',
+    'alice,arn:aws:iam::123:user/alice,2017-01-01T00:00:00+00:00,true,'
+    'no_information,2017-02-01T10:20:30+00:00,N/A,true,'
+    'true,2017-03-01T00:00:00+00:00,2017-04-01T00:00:00+00:00,eu-west-1,s3,'
+    'false,2017-05-01T00:00:00+00:00,N/A,N/A,N/A,false,N/A,false,N/A',
+    'bob,arn:aws:iam::123:user/bob,2017-01-01T00:00:00+00:00,false,N/A,N/A,'
+    'N/A,false,false,N/A,N/A,N/A,N/A,false,N/A,N/A,N/A,N/A,false,N/A,false,N/A'
+])
+
+def create_user(name):
+    """ Returns a user node of the account 123 """
+    return Node(json={'UserName': name, 'Arn': 'arn:aws:iam::123:user/' + name},
+                resource_type='User', id_type='Arn')
+
+class CredentialReportTest(unittest.TestCase):
+    """ Tests of the login details read from the credential report """
+
+    def test_login_details_from_report(self):
+        alice = create_user('alice')
+        bob = create_user('bob')
+        add_login_details_from_report(REPORT, [alice, bob])
+        self.assertEqual([child.resource_type for child in alice.children],
+                         ['LoginProfile', 'AccessKey', 'AccessKey',
+                          'MFADevice'])
+        login_profile, key, other_key, mfa_device = alice.children
+        self.assertEqual(login_profile.json['PasswordLastChanged'],
+                         '2017-02-01T10:20:30+00:00')
+        self.assertIsNone(login_profile.json['PasswordLastUsed'])
+        self.assertIn('Password Last Changed : 2017-02-01 10:20:30',
+                      login_profile.label)
+        self.assertEqual((key.json['Status'], key.json['LastUsedRegion']),
+                         ('Active', 'eu-west-1'))
+        self.assertEqual((other_key.json['Status'],
+                          other_key.json['LastUsedDate']), ('Inactive', None))
+        # The nodes without id in the report get distinct custom ids
+        self.assertNotEqual(key.id, other_key.id)
+        self.assertEqual(mfa_device.json, {
+            'UserName': 'alice', 'CustomId': mfa_device.id})
+        self.assertEqual(bob.children, [])
+
+class FakeIamClient(object):
+    """ iam client whose report generation completes on the second call """
+
+    def __init__(self):
+        self.states = ['STARTED', 'COMPLETE']
+
+    def generate_credential_report(self):
+        return {'State': self.states.pop(0)}
+
+    def get_credential_report(self):
+        return {'Content': REPORT}
+
+class GetCredentialReportTest(unittest.TestCase):
+    """ Tests of the credential report generation """
+
+    def setUp(self):
+        self._delay = IAM.CREDENTIAL_REPORT_DELAY
+        IAM.CREDENTIAL_REPORT_DELAY = 0
+
+    def tearDown(self):
+        IAM.CREDENTIAL_REPORT_DELAY = self._delay
+
+    def test_report_is_read_once_generated(self):
+        iam_client = FakeIamClient()
+        self.assertEqual(get_credential_report(iam_client), REPORT)
+        self.assertEqual(iam_client.states, [])
+
+    def test_report_generation_not_completed(self):
+        iam_client = FakeIamClient()
+        iam_client.states = ['STARTED'] * IAM.CREDENTIAL_REPORT_ATTEMPTS
+        self.assertIsNone(get_credential_report(iam_client))
+
+if __name__ == '__main__':
+    unittest.main()
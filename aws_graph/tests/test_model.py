@@ -0,0 +1,129 @@
+import pickle
+import logging
+import unittest
+
+from libraries.model import Node, create_account_node
+from libraries.model import registry, get_account_id, get_region
+from libraries.model.Model import ChildList, create_region_node
+
+def create_node(resource_type, node_id, father=None):
+    """ Returns a node of the type with the id and the father """
+    return Node(json={'Id': node_id}, resource_type=resource_type,
+                id_type='Id', father=father)
+
+class ChildListTest(unittest.TestCase):
+    """ Tests of the child lists grouped by resource type """
+
+    def setUp(self):
+        self.vpc = create_node('Vpc', 'vpc-1')
+        self.subnet = create_node('Subnet', 'subnet-1')
+        self.other_vpc = create_node('Vpc', 'vpc-2')
+        self.children = ChildList([self.vpc, self.subnet])
+
+    def test_append_and_extend_index_the_types(self):
+        self.children.append(self.other_vpc)
+        self.assertEqual(self.children.get_type('Vpc'),
+                         [self.vpc, self.other_vpc])
+        self.assertEqual(self.children.get_type('Subnet'), [self.subnet])
+        self.assertEqual(self.children.get_type('Instance'), [])
+        self.children += [create_node('Instance', 'i-1')]
+        self.assertEqual(len(self.children.get_type('Instance')), 1)
+        self.assertEqual(len(self.children), 4)
+
+    def test_removals_and_insertions_reindex(self):
+        self.children.remove(self.vpc)
+        self.assertEqual(self.children.get_type('Vpc'), [])
+        self.children.insert(0, self.other_vpc)
+        self.assertEqual(self.children.get_type('Vpc'), [self.other_vpc])
+        self.assertIs(self.children.pop(0), self.other_vpc)
+        self.assertEqual(self.children.get_type('Vpc'), [])
+        self.assertEqual(self.children, [self.subnet])
+
+    def test_list_reads(self):
+        self.assertEqual(list(self.children), [self.vpc, self.subnet])
+        self.assertIs(self.children[1], self.subnet)
+        self.assertEqual(self.children[:1], [self.vpc])
+        self.assertIn(self.vpc, self.children)
+        self.assertNotEqual(self.children, [])
+        self.assertEqual(ChildList(), [])
+
+    def test_pickled_child_list_is_reindexed(self):
+        children = pickle.loads(pickle.dumps(self.children, 2))
+        self.assertEqual([child.id for child in children.get_type('Vpc')],
+                         ['vpc-1'])
+        self.assertEqual(len(children), 2)
+
+class NodeRegistryTest(unittest.TestCase):
+    """ Tests of the node indexes by account """
+
+    def setUp(self):
+        registry.clear()
+        self.account = create_account_node(json={'Id': '123'})
+        self.other_account = create_account_node(json={'Id': '456'})
+
+    def tearDown(self):
+        registry.clear()
+
+    def test_nodes_are_registered_by_account(self):
+        vpc = create_node('Vpc', 'vpc-1', father=self.account)
+        other_vpc = create_node('Vpc', 'vpc-1', father=self.other_account)
+        self.assertIs(registry.get('123', 'Vpc', 'vpc-1'), vpc)
+        self.assertIs(registry.get('456', 'Vpc', 'vpc-1'), other_vpc)
+        self.assertIsNone(registry.get('123', 'Vpc', 'vpc-2'))
+        self.assertEqual(len(registry.get_type('Vpc')), 2)
+
+    def test_nodes_without_account_are_not_registered(self):
+        create_node('Vpc', 'vpc-1')
+        self.assertEqual(registry.get_type('Vpc'), [])
+
+    def test_first_registered_node_is_kept(self):
+        vpc = create_node('Vpc', 'vpc-1', father=self.account)
+        create_node('Vpc', 'vpc-1', father=self.account)
+        self.assertIs(registry.get('123', 'Vpc', 'vpc-1'), vpc)
+        self.assertEqual(registry.get_type('Vpc'), [vpc])
+
+    def test_canonicalize_merges_the_json(self):
+        bucket = Node(json={'Name': 'logs', 'CreationDate': 'now'},
+                      resource_type='Bucket', id_type='Name',
+                      father=self.account)
+        placeholder = Node(json={'Name': 'logs', 'Policy': 'p'},
+                           resource_type='Bucket', id_type='Name',
+                           father=self.account)
+        self.assertIs(registry.canonicalize(placeholder), bucket)
+        self.assertIs(registry.canonicalize(bucket), bucket)
+        self.assertEqual(bucket.json['Policy'], 'p')
+
+    def test_duplicates_of_unshared_types_are_logged(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('libraries.model.Model')
+        logger.addHandler(handler)
+        try:
+            create_node('Vpc', 'vpc-1', father=self.account)
+            create_node('Vpc', 'vpc-1', father=self.account)
+            create_node('Bucket', 'logs', father=self.account)
+            create_node('Bucket', 'logs', father=self.account)
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual([record.getMessage() for record in records],
+                         ['Vpc vpc-1 of account 123 is already registered,'
+                          ' the duplicate node is not indexed'])
+
+    def test_release_account_drops_its_indexes(self):
+        create_node('Vpc', 'vpc-1', father=self.account)
+        other_vpc = create_node('Vpc', 'vpc-1', father=self.other_account)
+        registry.release_account('123')
+        self.assertIsNone(registry.get('123', 'Vpc', 'vpc-1'))
+        self.assertEqual(registry.get_type('Vpc'), [other_vpc])
+
+    def test_account_and_region_of_a_node(self):
+        region = create_region_node(self.account, 'eu-west-1')
+        vpc = create_node('Vpc', 'vpc-1', father=region)
+        self.assertEqual(get_account_id(vpc), '123')
+        self.assertEqual(get_region(vpc), 'eu-west-1')
+        self.assertIsNone(get_region(self.account))
+        self.assertIsNone(get_account_id(create_node('Vpc', 'vpc-2')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from libraries.Pagination import get_pages, get_items
+
+class FakePaginator(object):
+    """ Paginator returning the given pages and keeping its arguments """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.kwargs = None
+
+    def paginate(self, **kwargs):
+        self.kwargs = kwargs
+        return iter(self.pages)
+
+class FakeClient(object):
+    """ Client returning the given pages, with or without a paginator """
+
+    def __init__(self, pages, paginated=False):
+        self.pages = list(pages)
+        self.paginated = paginated
+        self.paginator = FakePaginator(pages)
+        self.calls = []
+
+    def can_paginate(self, operation):
+        return self.paginated
+
+    def get_paginator(self, operation):
+        return self.paginator
+
+    def list_things(self, **kwargs):
+        self.calls.append(dict(kwargs))
+        return self.pages.pop(0)
+
+class PaginationTest(unittest.TestCase):
+    """ Tests of the pagination of the API calls """
+
+    def test_paginator_gets_the_maximum_page_size(self):
+        client = FakeClient([{'Vpcs': [1]}, {'Vpcs': [2]}], paginated=True)
+        items = list(get_items(client, 'describe_vpcs', 'Vpcs', Filters=[]))
+        self.assertEqual(items, [1, 2])
+        self.assertEqual(client.paginator.kwargs,
+                         {'PaginationConfig': {'PageSize': 1000},
+                          'Filters': []})
+
+    def test_paginator_without_maximum_page_size(self):
+        client = FakeClient([{'Trails': []}], paginated=True)
+        list(get_pages(client, 'list_trails'))
+        self.assertEqual(client.paginator.kwargs, {'PaginationConfig': {}})
+
+    def test_next_token_pagination(self):
+        client = FakeClient([{'Items': [1], 'NextToken': 'a'},
+                             {'Items': [2], 'NextToken': 'b'},
+                             {'Items': [3]}])
+        items = list(get_items(client, 'list_things', 'Items', Name='x'))
+        self.assertEqual(items, [1, 2, 3])
+        self.assertEqual(client.calls, [{'Name': 'x'},
+                                        {'Name': 'x', 'NextToken': 'a'},
+                                        {'Name': 'x', 'NextToken': 'b'}])
+
+    def test_marker_pagination_stops_when_not_truncated(self):
+        client = FakeClient([{'Items': [1], 'Marker': 'a', 'IsTruncated': True},
+                             {'Items': [2], 'Marker': 'b',
+                              'IsTruncated': False}])
+        items = list(get_items(client, 'list_things', 'Items'))
+        self.assertEqual(items, [1, 2])
+        self.assertEqual(client.calls, [{}, {'Marker': 'a'}])
+
+    def test_missing_result_key(self):
+        client = FakeClient([{'Items': None}])
+        self.assertEqual(list(get_items(client, 'list_things', 'Items')), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+import libraries.RateLimit as RateLimit
+from libraries.RateLimit import TokenBucket, RateLimiter
+from libraries.RateLimit import is_throttling_response
+
+class FakeClock(object):
+    """ Replaces time.time and time.sleep of the rate limiter module,
+        sleeping only moves the clock forward
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class TokenBucketTest(unittest.TestCase):
+    """ Tests of the adaptive token bucket """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self._time = RateLimit.time
+        RateLimit.time = self.clock
+
+    def tearDown(self):
+        RateLimit.time = self._time
+
+    def test_burst_up_to_the_capacity_then_waits(self):
+        bucket = TokenBucket(rate=2, max_rate=10)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(len(self.clock.sleeps), 1)
+        self.assertAlmostEqual(self.clock.sleeps[0], 0.5)
+
+    def test_tokens_are_refilled_at_the_rate(self):
+        bucket = TokenBucket(rate=4, max_rate=10)
+        for _ in range(4):
+            bucket.acquire()
+        self.clock.now += 0.5
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_throttle_halves_the_rate(self):
+        bucket = TokenBucket(rate=8, max_rate=10)
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 4)
+        self.assertEqual(bucket.capacity, 4)
+        self.assertLessEqual(bucket.tokens, 4)
+
+    def test_throttle_keeps_the_minimum_rate(self):
+        bucket = TokenBucket(rate=2, max_rate=10)
+        for _ in range(10):
+            bucket.on_throttle()
+        self.assertEqual(bucket.rate, 1)
+        self.assertEqual(bucket.capacity, 1)
+
+    def test_success_increases_the_rate_up_to_the_maximum(self):
+        bucket = TokenBucket(rate=2, max_rate=3)
+        bucket.on_success()
+        self.assertEqual(bucket.rate, 2.5)
+        for _ in range(10):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 3)
+
+class RateLimiterTest(unittest.TestCase):
+    """ Tests of the token buckets sharing """
+
+    def test_one_bucket_by_key(self):
+        rate_limiter = RateLimiter(rate=10, max_rate=100, max_attempts=5)
+        bucket = rate_limiter.get_bucket(('123', 'ec2', 'eu-west-1'))
+        self.assertIs(rate_limiter.get_bucket(('123', 'ec2', 'eu-west-1')),
+                      bucket)
+        self.assertIsNot(rate_limiter.get_bucket(('456', 'ec2', 'eu-west-1')),
+                         bucket)
+
+    def test_throttling_responses(self):
+        self.assertTrue(is_throttling_response(
+            {'Error': {'Code': 'Throttling'}}))
+        self.assertFalse(is_throttling_response(
+            {'Error': {'Code': 'AccessDenied'}}))
+        self.assertFalse(is_throttling_response({}))
+        self.assertFalse(is_throttling_response(None))
+
+if __name__ == '__main__':
+    unittest.main()
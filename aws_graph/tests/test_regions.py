@@ -0,0 +1,130 @@
+import shutil
+import tempfile
+import unittest
+
+import boto3
+from botocore.stub import Stubber
+
+from libraries import get_client, release_clients
+from libraries.Cache import load_cache
+from libraries.Regions import is_region_active, get_active_regions
+from libraries.model import create_account_node
+
+ACCOUNT_ID = '123'
+
+class IsRegionActiveTest(unittest.TestCase):
+    """ Tests of the region probe calls, checked against the service models
+        of botocore by stubbed clients
+    """
+
+    def setUp(self):
+        self.session = boto3.Session(aws_access_key_id='key',
+                                     aws_secret_access_key='secret')
+        self.stubbers = {}
+        for service in ('ec2', 'rds', 'cloudtrail'):
+            # The probe gets the stubbed clients from the client cache
+            client = get_client(self.session, service, 'eu-west-1',
+                                account_id=ACCOUNT_ID)
+            self.stubbers[service] = Stubber(client)
+            self.stubbers[service].activate()
+
+    def tearDown(self):
+        for stubber in self.stubbers.values():
+            stubber.deactivate()
+        release_clients(ACCOUNT_ID)
+
+    def add_probe_responses(self, vpcs=None, reservations=None,
+                            db_instances=None, trails=None):
+        """ Stubbing the probe calls up to the first resources found """
+        ec2 = self.stubbers['ec2']
+        ec2.add_response(
+            'describe_vpcs', {'Vpcs': vpcs or []},
+            {'Filters': [{'Name': 'isDefault', 'Values': ['false']}]})
+        if vpcs:
+            return
+        ec2.add_response(
+            'describe_instances', {'Reservations': reservations or []},
+            {'Filters': [{'Name': 'instance-state-name',
+                          'Values': ['pending', 'running', 'stopping',
+                                     'stopped']}],
+             'MaxResults': 5})
+        if reservations:
+            return
+        self.stubbers['rds'].add_response(
+            'describe_db_instances', {'DBInstances': db_instances or []},
+            {'MaxRecords': 20})
+        if db_instances:
+            return
+        self.stubbers['cloudtrail'].add_response(
+            'describe_trails', {'trailList': trails or []},
+            {'includeShadowTrails': False})
+
+    def probe(self):
+        active = is_region_active(self.session, ACCOUNT_ID, 'eu-west-1')
+        for stubber in self.stubbers.values():
+            stubber.assert_no_pending_responses()
+        return active
+
+    def test_empty_region(self):
+        self.add_probe_responses()
+        self.assertFalse(self.probe())
+
+    def test_region_with_a_vpc(self):
+        self.add_probe_responses(vpcs=[{'VpcId': 'vpc-1'}])
+        self.assertTrue(self.probe())
+
+    def test_region_with_an_instance(self):
+        self.add_probe_responses(reservations=[{'ReservationId': 'r-1'}])
+        self.assertTrue(self.probe())
+
+    def test_region_with_a_db_instance(self):
+        self.add_probe_responses(db_instances=[{'DBInstanceIdentifier': 'db'}])
+        self.assertTrue(self.probe())
+
+    def test_region_with_a_trail(self):
+        self.add_probe_responses(trails=[{'Name': 'trail'}])
+        self.assertTrue(self.probe())
+
+class FakeProbe(object):
+    """ Finished probe task """
+
+    def __init__(self, result=False, error=None):
+        self.result = result
+        self.error = error
+
+class GetActiveRegionsTest(unittest.TestCase):
+    """ Tests of the active regions cache """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.config = {'CACHE_DIR': self.cache_dir}
+        self.account = create_account_node(json={'Id': ACCOUNT_ID})
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def load_active_regions(self):
+        return load_cache(self.config, 'active-regions-' + ACCOUNT_ID, 60)
+
+    def test_probed_regions_are_cached(self):
+        probes = [('r1', FakeProbe(True)), ('r2', FakeProbe(False))]
+        self.assertEqual(get_active_regions(self.account, ['r1', 'r2'], None,
+                                            probes, self.config), ['r1'])
+        self.assertEqual(self.load_active_regions(), ['r1'])
+
+    def test_failed_probes_are_scanned_but_not_cached(self):
+        probes = [('r1', FakeProbe(error=ValueError())),
+                  ('r2', FakeProbe(False))]
+        self.assertEqual(get_active_regions(self.account, ['r1', 'r2'], None,
+                                            probes, self.config), ['r1'])
+        self.assertIsNone(self.load_active_regions())
+
+    def test_known_regions_are_kept(self):
+        probes = [('r2', FakeProbe(True))]
+        self.assertEqual(get_active_regions(self.account, ['r1', 'r2', 'r3'],
+                                            ['r1'], probes, self.config),
+                         ['r1', 'r2'])
+        self.assertIsNone(self.load_active_regions())
+
+if __name__ == '__main__':
+    unittest.main()
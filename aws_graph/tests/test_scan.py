@@ -0,0 +1,55 @@
+import unittest
+
+from botocore.exceptions import ClientError
+
+import libraries.Scan as Scan
+from libraries.Scan import scan_account, scan_in_processes
+from libraries.model import create_account_node, registry
+
+CONFIG = {'workers': 2, 'iam-workers': 2, 'processes': 2, 'rate-limit': 0,
+          'MaxRateLimit': 100, 'ThrottlingRetries': 10}
+
+def fail_to_assume_role(account, config):
+    """ get_session raising the error of a denied assume role """
+    raise ClientError({'Error': {'Code': 'AccessDenied'}}, 'AssumeRole')
+
+class ScanAccountTest(unittest.TestCase):
+    """ Tests of the account scans run in processes """
+
+    def setUp(self):
+        registry.clear()
+        self._get_session = Scan.get_session
+        self._set_rate_limiter = Scan.set_rate_limiter
+        Scan.set_rate_limiter = lambda **options: None
+
+    def tearDown(self):
+        Scan.get_session = self._get_session
+        Scan.set_rate_limiter = self._set_rate_limiter
+        registry.clear()
+
+    def test_failed_connection(self):
+        Scan.get_session = lambda account, config: None
+        account = create_account_node(json={'Id': '123'})
+        self.assertEqual(scan_account((2, account, CONFIG, {})), (2, None))
+
+    def test_failed_scan_is_not_raised(self):
+        Scan.get_session = fail_to_assume_role
+        account = create_account_node(json={'Id': '123'})
+        self.assertEqual(scan_account((2, account, CONFIG, {})), (2, None))
+
+    def test_failed_scans_in_processes(self):
+        # The processes are forked with the failing get_session
+        Scan.get_session = fail_to_assume_role
+        account_list = [create_account_node(json={'Id': account_id})
+                        for account_id in ('123', '456')]
+        accounts = list(account_list)
+        scanned_accounts = []
+        scan_in_processes(account_list, CONFIG, {},
+                          on_account_scanned=scanned_accounts.append)
+        # The accounts are handed over unscanned
+        self.assertEqual(account_list, accounts)
+        self.assertEqual(sorted(account.id for account in scanned_accounts),
+                         ['123', '456'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+from libraries.model import Node, traverse
+
+def create_node(node_id, *children):
+    """ Returns a node without account (not registered) with the children """
+    node = Node(json={'Id': node_id}, resource_type='Test', id_type='Id')
+    for child in children:
+        child.father = node
+        node.children.append(child)
+    return node
+
+def visit(roots, max_depth=-1):
+    """ Returns the pre order, post order and edges of a traversal """
+    pre, post, edges = [], [], []
+    traverse(roots, max_depth=max_depth,
+             pre_order=lambda node: pre.append(node.id),
+             post_order=lambda node: post.append(node.id),
+             edge=lambda father, child: edges.append((father.id, child.id)))
+    return pre, post, edges
+
+class TraversalTest(unittest.TestCase):
+    """ Tests of the iterative depth first traversal """
+
+    def setUp(self):
+        # a -> b -> d, a -> c -> d (d is shared)
+        self.d = create_node('d')
+        self.b = create_node('b', self.d)
+        self.c = create_node('c')
+        self.c.children.append(self.d)
+        self.a = create_node('a', self.b, self.c)
+
+    def test_depth_first_orders(self):
+        pre, post, edges = visit([self.a])
+        self.assertEqual(pre, ['a', 'b', 'd', 'c'])
+        self.assertEqual(post, ['d', 'b', 'c', 'a'])
+        self.assertEqual(edges, [('b', 'd'), ('a', 'b'), ('c', 'd'),
+                                 ('a', 'c')])
+
+    def test_shared_node_visited_once(self):
+        pre, _, _ = visit([self.a, self.b])
+        self.assertEqual(pre.count('d'), 1)
+        self.assertEqual(pre.count('b'), 1)
+
+    def test_traversal_can_be_run_again(self):
+        first = visit([self.a])
+        second = visit([self.a])
+        self.assertEqual(first, second)
+
+    def test_each_traversal_uses_a_new_generation(self):
+        visit([self.a])
+        generation = self.a._generation
+        visit([self.a])
+        self.assertGreater(self.a._generation, generation)
+        self.assertEqual(self.d._generation, self.a._generation)
+
+    def test_max_depth(self):
+        pre, post, edges = visit([self.a], max_depth=2)
+        self.assertEqual(pre, ['a', 'b', 'c'])
+        self.assertEqual(post, ['b', 'c', 'a'])
+        self.assertEqual(edges, [('a', 'b'), ('a', 'c')])
+        self.assertEqual(visit([self.a], max_depth=1), (['a'], ['a'], []))
+        self.assertEqual(visit([self.a], max_depth=0), ([], [], []))
+
+    def test_deep_tree_does_not_recurse(self):
+        root = node = create_node(0)
+        for depth in range(1, 5000):
+            child = create_node(depth)
+            node.children.append(child)
+            node = child
+        pre, _, _ = visit([root])
+        self.assertEqual(len(pre), 5000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import threading
+import unittest
+
+from libraries.Workers import WorkerPool
+
+class WorkerPoolTest(unittest.TestCase):
+    """ Tests of the worker pool and of its task dependencies """
+
+    def setUp(self):
+        self.pool = WorkerPool(4)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_submit_returns_the_task_result(self):
+        task = self.pool.submit(lambda x, y: x + y, 1, y=2)
+        self.pool.join()
+        self.assertTrue(task.finished)
+        self.assertEqual(task.result, 3)
+        self.assertIsNone(task.error)
+
+    def test_failed_task_keeps_its_error(self):
+        def fail():
+            raise ValueError('failed')
+        task = self.pool.submit(fail)
+        self.pool.join()
+        self.assertTrue(task.finished)
+        self.assertIsInstance(task.error, ValueError)
+
+    def test_submit_after_waits_for_the_dependencies(self):
+        order = []
+        release = threading.Event()
+        def first():
+            release.wait(5)
+            order.append('first')
+        dependency = self.pool.submit(first)
+        dependent = self.pool.submit_after([dependency], order.append, 'second')
+        self.assertFalse(dependent.finished)
+        release.set()
+        self.pool.join()
+        self.assertEqual(order, ['first', 'second'])
+
+    def test_submit_after_finished_dependencies_is_queued(self):
+        dependency = self.pool.submit(lambda: None)
+        self.pool.join()
+        dependent = self.pool.submit_after([dependency], lambda: 'done')
+        self.pool.join()
+        self.assertEqual(dependent.result, 'done')
+
+    def test_failed_dependency_skips_the_dependent(self):
+        calls = []
+        def fail():
+            raise ValueError('failed')
+        dependency = self.pool.submit(fail)
+        dependent = self.pool.submit_after([dependency], calls.append, 1)
+        self.pool.join()
+        self.assertTrue(dependent.finished)
+        self.assertIs(dependent.error, dependency.error)
+        self.assertEqual(calls, [])
+
+    def test_submit_when_finished_runs_after_a_failure(self):
+        calls = []
+        def fail():
+            raise ValueError('failed')
+        dependency = self.pool.submit(fail)
+        dependent = self.pool.submit_when_finished([dependency],
+                                                   calls.append, 1)
+        self.pool.join()
+        self.assertIsNone(dependent.error)
+        self.assertEqual(calls, [1])
+
+    def test_join_waits_for_the_tasks_submitted_by_tasks(self):
+        results = []
+        def submit_child():
+            self.pool.submit(results.append, 'child')
+        self.pool.submit(submit_child)
+        self.pool.join()
+        self.assertEqual(results, ['child'])
+
+    def test_wait_only_waits_for_the_given_tasks(self):
+        release = threading.Event()
+        other = self.pool.submit(release.wait, 5)
+        task = self.pool.submit(lambda: 'done')
+        self.pool.wait([task])
+        self.assertEqual(task.result, 'done')
+        self.assertFalse(other.finished)
+        release.set()
+        self.pool.join()
+
+    def test_close_joins_the_workers(self):
+        threads = list(self.pool._threads)
+        self.pool.close()
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+import io
+import os
+import gzip
+import json
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+
+import libraries.Graph as Graph
+import libraries.SqlitePrint as SqlitePrint
+from libraries import JsonWriter, SqliteWriter, DotWriter, GraphWriter
+from libraries import ExportStage, get_default_graph
+from libraries.model import Node, create_account_node, registry
+from libraries.model.Model import create_region_node
+
+def create_tree():
+    """ Returns an account with a region holding a vpc, and a bucket
+        shared by the account and the vpc
+    """
+    account = create_account_node(json={'Id': '123', 'Name': u'compt\xe9'})
+    region = create_region_node(account, 'eu-west-1')
+    account.children.append(region)
+    vpc = Node(json={'VpcId': 'vpc-1', 'Created': datetime(2020, 1, 1)},
+               resource_type='Vpc', id_type='VpcId', father=region)
+    region.children.append(vpc)
+    bucket = Node(json={'Name': 'logs'}, resource_type='Bucket',
+                  id_type='Name', father=account)
+    account.children.append(bucket)
+    vpc.children.append(bucket)
+    return account
+
+class WriterTest(unittest.TestCase):
+    """ The writers are run in a temporary directory holding
+        the aws-graph-output directory
+    """
+
+    def setUp(self):
+        registry.clear()
+        self._cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        os.makedirs('aws-graph-output')
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self.directory)
+        registry.clear()
+
+class JsonWriterTest(WriterTest):
+    """ Tests of the json and ndjson outputs """
+
+    def test_json_array(self):
+        writer = JsonWriter()
+        writer.write_nodes([create_tree()])
+        writer.close()
+        with io.open(writer.output_file_name, encoding='utf-8') as json_file:
+            records = json.load(json_file)
+        self.assertEqual([record.keys()[0] for record in records],
+                         ['Account', 'Region', 'Vpc', 'Bucket'])
+        self.assertEqual(records[0]['Account']['Name'], u'compt\xe9')
+        self.assertEqual(records[2]['Vpc']['Created'], '2020-01-01T00:00:00')
+
+    def test_compressed_ndjson(self):
+        writer = JsonWriter(ndjson=True, compress=True)
+        writer.write_nodes([create_tree()], max_depth=2)
+        writer.close()
+        self.assertTrue(writer.output_file_name.endswith('.ndjson.gz'))
+        with gzip.open(writer.output_file_name) as json_file:
+            lines = json_file.read().splitlines()
+        self.assertEqual(len(lines), 3)
+        # The non ascii characters are written in utf-8
+        self.assertIn(u'compt\xe9'.encode('utf-8'), lines[0])
+
+class SqliteWriterTest(WriterTest):
+    """ Tests of the sqlite inventory """
+
+    def test_nodes_and_edges(self):
+        writer = SqliteWriter()
+        writer.write_nodes([create_tree()])
+        writer.close()
+        connection = sqlite3.connect(writer.output_file_name)
+        rows = connection.execute(
+            'SELECT node, id, type, account, region, parent FROM nodes'
+            ' ORDER BY node').fetchall()
+        self.assertEqual(rows, [
+            (1, '123', 'Account', '123', None, None),
+            (2, '123_eu-west-1', 'Region', '123', 'eu-west-1', 1),
+            (3, 'vpc-1', 'Vpc', '123', 'eu-west-1', 2),
+            # The bucket is written once, with the account as father
+            (4, 'logs', 'Bucket', '123', None, 1),
+        ])
+        edges = connection.execute(
+            'SELECT parent, child FROM edges').fetchall()
+        self.assertEqual(sorted(edges), [(1, 2), (1, 4), (2, 3), (3, 4)])
+        connection.close()
+
+    def test_existing_inventory_is_replaced(self):
+        # Both inventories get the same file name
+        class FixedDatetime(object):
+            @staticmethod
+            def now():
+                return datetime(2020, 1, 1)
+        SqlitePrint.datetime = FixedDatetime
+        try:
+            for _ in range(2):
+                registry.clear()
+                writer = SqliteWriter()
+                writer.write_nodes([create_tree()])
+                writer.close()
+        finally:
+            SqlitePrint.datetime = datetime
+        connection = sqlite3.connect(writer.output_file_name)
+        self.assertEqual(
+            connection.execute('SELECT COUNT(*) FROM nodes').fetchone(), (4,))
+        connection.close()
+
+class FakeProcess(object):
+    """ dot process reading the graph from its standard input """
+
+    def __init__(self, return_code):
+        self.stdin = io.BytesIO()
+        self.stdin.close = lambda: None
+        self.return_code = return_code
+
+    def wait(self):
+        return self.return_code
+
+class FakeSubprocess(object):
+    """ Replaces the subprocess module of the Graph module """
+
+    PIPE = -1
+
+    def __init__(self, return_code=0, missing=False):
+        self.return_code = return_code
+        self.missing = missing
+        self.calls = []
+        self.process = None
+
+    def call(self, args):
+        self.calls.append(args)
+        if self.missing:
+            raise OSError(2, 'No such file or directory')
+        return self.return_code
+
+    def Popen(self, args, stdin=None):
+        self.calls.append(args)
+        if self.missing:
+            raise OSError(2, 'No such file or directory')
+        self.process = FakeProcess(self.return_code)
+        return self.process
+
+class DotWriterTest(WriterTest):
+    """ Tests of the streamed graphviz output """
+
+    def setUp(self):
+        WriterTest.setUp(self)
+        self._subprocess = Graph.subprocess
+
+    def tearDown(self):
+        Graph.subprocess = self._subprocess
+        WriterTest.tearDown(self)
+
+    def test_file_rendered_by_dot(self):
+        Graph.subprocess = FakeSubprocess()
+        writer = DotWriter({'s3': True})
+        writer.write_nodes([create_tree()])
+        writer.close()
+        with open(writer.output_filename) as dot_file:
+            lines = dot_file.read().splitlines()
+        self.assertEqual(lines[0], 'digraph AWS {')
+        self.assertEqual(lines[-1], '}')
+        self.assertEqual(len([line for line in lines if '->' in line]), 4)
+        self.assertEqual(Graph.subprocess.calls,
+                         [['dot', '-Tsvg', '-O', writer.output_filename]])
+
+    def test_edges_written_once(self):
+        Graph.subprocess = FakeSubprocess()
+        account = create_tree()
+        writer = DotWriter({})
+        writer.write_nodes([account])
+        writer.write_nodes([account])
+        writer.close()
+        with open(writer.output_filename) as dot_file:
+            lines = dot_file.read().splitlines()
+        self.assertEqual(len([line for line in lines if '->' in line]), 4)
+
+    def test_missing_dot_keeps_the_file(self):
+        Graph.subprocess = FakeSubprocess(missing=True)
+        writer = DotWriter({}, to_dot=True)
+        writer.write_nodes([create_tree()])
+        writer.close()
+        self.assertTrue(os.path.exists(writer.output_filename))
+        # dot is not run again to render the file
+        self.assertEqual(len(Graph.subprocess.calls), 1)
+
+    def test_dot_standard_input(self):
+        Graph.subprocess = FakeSubprocess()
+        writer = DotWriter({}, output_image_format='png', to_dot=True)
+        writer.write_nodes([create_tree()])
+        writer.close()
+        self.assertEqual(Graph.subprocess.calls,
+                         [['dot', '-Tpng', '-o', writer.image_filename]])
+        self.assertTrue(Graph.subprocess.process.stdin.getvalue()
+                        .endswith('}\n'))
+        self.assertFalse(os.path.exists(writer.output_filename))
+
+    def test_failing_dot_is_reported(self):
+        stdout = sys.stdout
+        sys.stdout = io.BytesIO()
+        try:
+            for to_dot in (False, True):
+                Graph.subprocess = FakeSubprocess(return_code=1)
+                writer = DotWriter({}, to_dot=to_dot)
+                writer.write_nodes([create_tree()])
+                writer.close()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output.count('dot exited with code 1'), 2)
+
+class ExportStageTest(WriterTest):
+    """ Tests of the writers driven by the export thread """
+
+    def setUp(self):
+        WriterTest.setUp(self)
+        self._subprocess = Graph.subprocess
+        self._render_graph = Graph.render_graph
+        self._batch_size = SqlitePrint.BATCH_SIZE
+
+    def tearDown(self):
+        Graph.subprocess = self._subprocess
+        Graph.render_graph = self._render_graph
+        SqlitePrint.BATCH_SIZE = self._batch_size
+        WriterTest.tearDown(self)
+
+    def export(self, writer, **options):
+        """ Exporting two accounts and an empty one with the writer """
+        stage = ExportStage(writer, **options)
+        accounts = [create_tree(), create_tree(),
+                    create_account_node(json={'Id': '456'})]
+        for account in accounts:
+            stage.put(account)
+        stage.close()
+        # The exported subtrees are released
+        self.assertEqual([account.children for account in accounts],
+                         [[], [], []])
+        self.assertIsNone(registry.get('123', 'Vpc', 'vpc-1'))
+
+    def test_json_writer(self):
+        writer = JsonWriter(ndjson=True)
+        self.export(writer)
+        with open(writer.output_file_name) as json_file:
+            lines = json_file.read().splitlines()
+        self.assertEqual(len(lines), 9)
+
+    def test_sqlite_writer(self):
+        # The batches are inserted during the traversals
+        SqlitePrint.BATCH_SIZE = 3
+        writer = SqliteWriter()
+        self.export(writer)
+        connection = sqlite3.connect(writer.output_file_name)
+        self.assertEqual(
+            connection.execute('SELECT COUNT(*) FROM nodes').fetchone(), (9,))
+        self.assertEqual(
+            connection.execute('SELECT COUNT(*) FROM edges').fetchone(), (8,))
+        connection.close()
+
+    def test_dot_writer(self):
+        Graph.subprocess = FakeSubprocess()
+        writer = DotWriter({})
+        self.export(writer, skip_empty_accounts=True)
+        with open(writer.output_filename) as dot_file:
+            lines = dot_file.read().splitlines()
+        # The empty account is skipped
+        self.assertEqual(len([line for line in lines
+                              if line.startswith('\t"Account')
+                              and '->' not in line]), 2)
+        self.assertEqual(len(Graph.subprocess.calls), 1)
+
+    def test_graph_writer(self):
+        rendered = []
+        Graph.render_graph = lambda graph, services, image_format: \
+            rendered.append(graph)
+        writer = GraphWriter({})
+        self.export(writer, max_depth=2, skip_empty_accounts=True)
+        self.assertEqual(rendered, [writer.graph])
+        # The accounts, their region and bucket and the edges between them
+        self.assertEqual(len(writer.graph.body) - len(get_default_graph().body),
+                         10)
+
+if __name__ == '__main__':
+    unittest.main()